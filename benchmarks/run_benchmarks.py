@@ -0,0 +1,199 @@
+"""
+Benchmarks of the minet pipeline stages
+
+Times and memory-profiles each stage on synthetic feature tables (see minet.synthetic) across a grid of
+features x samples, and writes the results into a JSON file so the versions can be compared.
+
+- preprocess: Preprocessor.undersampling_by_depth and filter_by_prevalence
+- cooccurrence: cooccurrence.coocurrence_matrix of all the pairs
+- evaluate_pairs: interaction_analysis.evaluate_pairs (the work of job_permutation) of a tile of pairs
+- fdr: FDR.calc and FDR.adjust of the p-values of all the pairs
+- network: Network.load_interaction_results of the results of all the pairs
+- xgmml: CytoscapeXGMML.write_graph (Network.write_graph) of the network
+
+Usage:
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py -o new.json --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+import psutil
+
+from minet import synthetic, cooccurrence, interaction_analysis
+from minet.preprocess import Preprocessor
+from minet.fdr import FDR
+from minet.network import Network
+
+
+STAGES = ['preprocess', 'cooccurrence', 'evaluate_pairs', 'fdr', 'network', 'xgmml']
+
+parser = argparse.ArgumentParser(description='Benchmarks of the minet pipeline stages')
+parser.add_argument('-o', dest='output', type=str, default='benchmark_results.json',
+                    help='Output JSON file (default: benchmark_results.json)')
+parser.add_argument('--features', type=int, nargs='+', default=[100, 300, 1000],
+                    help='Numbers of features of the grid (default: 100 300 1000)')
+parser.add_argument('--samples', type=int, nargs='+', default=[50, 200],
+                    help='Numbers of samples of the grid (default: 50 200)')
+parser.add_argument('--stages', type=str, nargs='+', choices=STAGES, default=STAGES,
+                    help='Benchmarked stages (default: all)')
+parser.add_argument('--sparsity', type=float, default=0.7,
+                    help='Fraction of absent features in the samples (default: 0.7)')
+parser.add_argument('--tile-features', type=int, default=30,
+                    help='Features of the tile evaluated by evaluate_pairs (default: 30)')
+parser.add_argument('--directionality-method', dest='directionality', type=str, default='permutation',
+                    choices=['permutation', 'exact', 'sequential'],
+                    help='Directionality test of evaluate_pairs (default: permutation)')
+parser.add_argument('--repeat', type=int, default=3,
+                    help='Repetitions of each stage; the fastest is reported (default: 3)')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Random seed of the synthetic data (default: 0)')
+parser.add_argument('--compare', type=str, default=None,
+                    help='Baseline JSON file; reports the ratios of the times to the baseline')
+parser.add_argument('--tolerance', type=float, default=1.5,
+                    help='With --compare, exits with an error if a stage is slower than tolerance x baseline '
+                         '(default: 1.5)')
+
+
+def measure(func, repeat=3):
+    """
+    Runs func repeat times
+
+    Returns the fastest wall time (s), the peak of the traced memory allocations (MB) and the increase of
+    the resident set size of the process (MB).
+    """
+    process = psutil.Process()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    rss = process.memory_info().rss
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss = max(0, process.memory_info().rss - rss)
+    return min(seconds), peak / 2**20, rss / 2**20
+
+
+def benchmark(n_features, n_samples, stages, workdir, sparsity=0.7, tile_features=30, directionality='permutation',
+              repeat=3, seed=0):
+    """
+    Benchmarks the stages on a synthetic table of n_features x n_samples
+
+    Returns a list of records (dict) per stage.
+    """
+    table, _ = synthetic.generate_feature_table(n_features, n_samples, sparsity=sparsity,
+                                                n_directional=n_features // 20, seed=seed)
+    n_pairs = n_features * (n_features - 1) // 2
+    results = synthetic.generate_results(n_features, seed=seed)
+    result_file = os.path.join(workdir, 'results.tsv')
+    results.to_csv(result_file, sep='\t')
+    network = Network()
+    network.load_interaction_results(result_file)
+
+    def preprocess():
+        pre = Preprocessor(table, seed=seed)
+        pre.undersampling_by_depth(10000)
+        pre.filter_by_prevalence(0.1)
+
+    n = min(tile_features, n_features)
+    jobs = {
+        'preprocess': (preprocess, n_features),
+        'cooccurrence': (lambda: cooccurrence.coocurrence_matrix(table), n_pairs),
+        'evaluate_pairs': (lambda: interaction_analysis.evaluate_pairs(
+            table.values, 0, n, 0, n, directionality=directionality, seed=seed), n * (n - 1) // 2),
+        'fdr': (lambda: (FDR().calc(results, 'P-value(FisherExact)'),
+                         FDR().adjust(results.copy(), ['P-value(FisherExact)', 'P-value(Pearson)'])), n_pairs),
+        'network': (lambda: Network().load_interaction_results(result_file), n_pairs),
+        'xgmml': (lambda: network.write_graph(os.path.join(workdir, 'network.xgmml'), 'xgmml'), len(network.edges)),
+    }
+
+    records = []
+    for stage in stages:
+        func, n_items = jobs[stage]
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                seconds, peak, rss = measure(func, repeat)
+            finally:
+                sys.stdout = stdout
+        records.append({'stage': stage, 'n_features': n_features, 'n_samples': n_samples, 'n_items': n_items,
+                        'seconds': seconds, 'items_per_second': n_items / seconds if seconds > 0 else None,
+                        'peak_memory_mb': peak, 'rss_increase_mb': rss})
+        print('%-15s %6d features %6d samples: %9.4f s %9.1f MB' % (stage, n_features, n_samples, seconds, peak))
+    return records
+
+
+def environment():
+    """
+    Returns the versions of minet, Python and the numeric libraries
+    """
+    try:
+        version = metadata.version('minet')
+    except metadata.PackageNotFoundError:
+        version = 'unknown'
+    return {'minet': version, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def compare(records, baseline, tolerance=1.5):
+    """
+    Prints the ratios of the times to the baseline records
+
+    Returns the records slower than tolerance x baseline.
+    """
+    base = {(r['stage'], r['n_features'], r['n_samples']): r['seconds'] for r in baseline}
+    slower = []
+    for r in records:
+        key = (r['stage'], r['n_features'], r['n_samples'])
+        if key not in base or not base[key]:
+            continue
+        ratio = r['seconds'] / base[key]
+        print('%-15s %6d features %6d samples: %6.2fx' % (*key, ratio))
+        if ratio > tolerance:
+            slower.append(r)
+    return slower
+
+
+def main():
+    args = parser.parse_args()
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_features in args.features:
+            for n_samples in args.samples:
+                records += benchmark(n_features, n_samples, args.stages, workdir, sparsity=args.sparsity,
+                                     tile_features=args.tile_features, directionality=args.directionality,
+                                     repeat=args.repeat, seed=args.seed)
+
+    settings = {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'tolerance')}
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'settings': settings, 'results': records}, f, indent=2)
+    print('Results:', args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        slower = compare(records, baseline, args.tolerance)
+        if slower:
+            print('Slower than %.2fx the baseline:' % args.tolerance,
+                  ', '.join('%s (%d x %d)' % (r['stage'], r['n_features'], r['n_samples']) for r in slower))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
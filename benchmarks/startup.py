@@ -0,0 +1,106 @@
+"""
+Startup time benchmark of the minet command line
+
+Runs the command line in fresh Python processes and reports the wall time and the heavy modules imported by each
+command, so that the sub-commands keep importing only what they need (see minet.arguments).
+
+Usage:
+    python benchmarks/startup.py -o startup.json
+    python benchmarks/startup.py --max-seconds 0.3
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Modules of the numeric stack
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'statsmodels', 'psutil', 'tqdm']
+
+# Commands and the heavy modules they may import
+COMMANDS = {
+    '--help': [],
+    'interaction --help': [],
+    'network --help': [],
+    'run --help': [],
+    'import minet.network': ['numpy', 'pandas', 'psutil'],
+}
+
+# Runs a command (arguments of the command line, or an import) and prints the imported heavy modules
+SCRIPT = '''
+import sys, json
+command = sys.argv[1]
+if command.startswith('import '):
+    __import__(command.split()[1])
+else:
+    from minet.main import main
+    sys.argv = ['minet'] + command.split()
+    try:
+        main()
+    except SystemExit:
+        pass
+print(json.dumps(sorted({m.split('.')[0] for m in sys.modules} & set(%r))), file=sys.stderr)
+''' % HEAVY_MODULES
+
+parser = argparse.ArgumentParser(description='Startup time benchmark of the minet command line')
+parser.add_argument('-o', dest='output', type=str, default=None,
+                    help='Output JSON file (optional)')
+parser.add_argument('--repeat', type=int, default=10,
+                    help='Runs of each command; the median is reported (default: 10)')
+parser.add_argument('--max-seconds', type=float, default=None,
+                    help='Exits with an error if a --help command takes longer (optional)')
+
+
+def run_command(command):
+    """
+    Runs a command in a new Python process
+
+    Returns the wall time (s) and the heavy modules imported by the command.
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', SCRIPT, command], capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - start
+    return seconds, json.loads(proc.stderr.strip().splitlines()[-1])
+
+
+def main():
+    args = parser.parse_args()
+
+    # Time of the interpreter alone
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append(time.perf_counter() - start)
+    baseline = statistics.median(times)
+    print('%-25s %8.3f s' % ('python', baseline))
+
+    records = []
+    failed = []
+    for command, allowed in COMMANDS.items():
+        runs = [run_command(command) for _ in range(args.repeat)]
+        seconds = statistics.median(r[0] for r in runs)
+        modules = runs[0][1]
+        records.append({'command': command, 'seconds': seconds, 'overhead_seconds': seconds - baseline,
+                        'heavy_modules': modules})
+        print('%-25s %8.3f s  %s' % (command, seconds, ', '.join(modules)))
+
+        unexpected = sorted(set(modules) - set(allowed))
+        if unexpected:
+            failed.append('%s imports %s' % (command, ', '.join(unexpected)))
+        if args.max_seconds is not None and command.endswith('--help') and seconds > args.max_seconds:
+            failed.append('%s takes %.3f s' % (command, seconds))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'interpreter_seconds': baseline, 'results': records}, f, indent=2)
+
+    if failed:
+        print('\n'.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Command line arguments module
+
+This module defines the arguments of the sub-commands. It only imports the standard library, so that the command line
+is parsed (and --help is printed) without loading the numeric stack, which is imported by the sub-commands that need it.
+"""
+
+import argparse
+
+# Network file formats (see network.FORMATS)
+NETWORK_FORMATS = ['xgmml', 'graphml', 'csr', 'npz', 'parquet', 'feather']
+
+
+def shard_spec(value):
+    """
+    Parses a shard K/N (1 <= K <= N)
+    """
+    try:
+        k, n = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('The shard should be K/N: %s' % value)
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError('The shard should be K/N with 1 <= K <= N: %s' % value)
+    return k, n
+
+
+# Arguments of the analysis (shared with the pipeline)
+analysis_parser = argparse.ArgumentParser(add_help=False)
+analysis_parser.add_argument('--depth', dest='depth', type=int, default=10000,
+                             help='Per sample read depth cutoff (default: %(default)s)')
+analysis_parser.add_argument('--prevalence', dest='prevalence', type=float, default=0.1,
+                             help='Per ASV prevalence cutoff (default: %(default)s)')
+analysis_parser.add_argument('--no-preprocess', dest='no_preprocess', action='store_true', default=False,             
+                             help='User this flag for preprocessed input data')
+analysis_parser.add_argument('--engine', dest='engine', type=str, default='matrix', choices=['matrix', 'pair'],
+                             help='Pair statistics engine: "matrix" evaluates the co-occurrence and quantitative association of all pairs at once, "pair" evaluates each pair in the workers (default: %(default)s)')
+analysis_parser.add_argument('--directionality-method', dest='directionality', type=str, default='permutation',
+                             choices=['permutation', 'exact', 'sequential'],
+                             help='Directionality test: "permutation" uses 999 random shuffles, "exact" uses the hypergeometric distribution, "sequential" stops the permutations early for clearly (non-)significant pairs (default: %(default)s)')
+analysis_parser.add_argument('--max-permutations', dest='max_permutations', type=int, default=9999,
+                             help='Maximum number of permutations of the sequential test for pairs close to the directionality p-value cutoff (default: %(default)s)')
+analysis_parser.add_argument('--exceedances', dest='exceedances', type=int, default=10,
+                             help='Number of permuted log ratios exceeding the observed one before the sequential test may stop (default: %(default)s)')
+analysis_parser.add_argument('--directionality-p-value', dest='pval_dir', type=float, default=0.05,
+                             help='Directionality p-value cutoff deciding when the sequential test stops (default: %(default)s)')
+analysis_parser.add_argument('--null-cache-size', dest='null_cache_size', type=int, default=0,
+                             help='Number of permutation null distributions shared across workers by marginal counts; 0 disables the cache (default: %(default)s)')
+analysis_parser.add_argument('--prescreen', dest='prescreen', type=float, default=None,
+                             help='Skip the directionality tests of the pairs whose Fisher\'s exact test p-value is not below this cutoff or with too few co-present samples for the correlation (default: no prescreen)')
+analysis_parser.add_argument('--max-memory', dest='max_memory', type=float, default=1024,
+                             help='Working memory budget of the workers in MB, which determines the size of the pair tiles (default: %(default)s)')
+analysis_parser.add_argument('--sparse', dest='sparse', action='store_true', default=False,
+                             help='Handle the feature table as a sparse matrix')
+analysis_parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=None,
+                             help='Directory of the binary copies of the feature tables (default: $MINET_CACHE_DIR or ~/.cache/minet)')
+analysis_parser.add_argument('--cache-size', dest='cache_size', type=float, default=10240,
+                             help='Size cap of the cache directory in MB; the least recently used tables are removed beyond the cap (default: %(default)s)')
+analysis_parser.add_argument('--no-cache', dest='no_cache', action='store_true', default=False,
+                             help='Parse and preprocess the feature table without the binary cache')
+analysis_parser.add_argument('--seed', dest='seed', type=int, default=None,
+                             help='Random seed of the undersampling and permutation tests (default: random)')
+analysis_parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                             help='Resume an interrupted analysis from the checkpoint of the output file')
+analysis_parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=float, default=300,
+                             help='Seconds between checkpoints (default: %(default)s)')
+
+# Arguments of the interaction analysis
+interaction_parser = argparse.ArgumentParser(add_help=False, parents=[analysis_parser])
+interaction_parser.add_argument('-i', dest='input', type=str,
+                                help='Input microbial feature table')
+interaction_parser.add_argument('-o', dest='output', type=str,
+                                help='Output interaction analysis result file')
+interaction_parser.add_argument('--shard', dest='shard', type=shard_spec, default=None,
+                                help='Evaluate the K-th of N slices of the pairs (K/N) and write the results without the adjusted p-values, to be combined by "minet merge" (requires --seed)')
+
+# Arguments of merging sharded results
+merge_parser = argparse.ArgumentParser(add_help=False)
+merge_parser.add_argument('-i', dest='input', type=str, nargs='+',
+                          help='Interaction analysis results of the shards')
+merge_parser.add_argument('-o', dest='output', type=str,
+                          help='Output interaction analysis result file')
+
+# Arguments of the network analysis
+network_parser = argparse.ArgumentParser(add_help=False)
+network_parser.add_argument('-i', dest='input', type=str,
+                            help='Input result file')
+network_parser.add_argument('-o', dest='output', type=str, default=None,
+                            help='Output network file, or statistics file of a threshold sweep '
+                                 '(default: network.xml, or network_sweep.tsv with a threshold sweep)')
+network_parser.add_argument('--fdr-cooccurrence', dest='fdr_co', default=0.05, type=float,
+                            help='FDR of coocurrence analysis (default: %(default)s)')
+network_parser.add_argument('--cooccurrence-type', dest='co_type', default='positive', type=str,
+                            help='Association type (default: %(default)s)')
+
+network_parser.add_argument('--fdr-quantitative', dest='fdr_qt', default=0.05, type=float,
+                            help='FDR of quantitative analysis (Pearson\'s correlation) (default: %(default)s)')
+network_parser.add_argument('--quantitative-type', dest='qt_type', default='positive', type=str,
+                            help='Association type (default: %(default)s)')
+
+network_parser.add_argument('--directionality-p-value', dest='pval_dir', default=0.05, type=float,
+                            help='Association type (default: %(default)s)')
+network_parser.add_argument('--format', dest='format', default=None, type=str, choices=NETWORK_FORMATS,
+                            help='Network file format (default: by the extension of the output file, or xgmml)')
+
+network_parser.add_argument('--sweep-fdr-cooccurrence', dest='sweep_fdr_co', default=None, type=float, nargs='+',
+                            help='FDRs of coocurrence analysis of a threshold sweep')
+network_parser.add_argument('--sweep-fdr-quantitative', dest='sweep_fdr_qt', default=None, type=float, nargs='+',
+                            help='FDRs of quantitative analysis of a threshold sweep')
+network_parser.add_argument('--sweep-directionality-p-value', dest='sweep_pval_dir', default=None, type=float, nargs='+',
+                            help='Directionality p-value cutoffs of a threshold sweep')
+network_parser.add_argument('--sweep-networks', dest='sweep_networks', action='store_true', default=False,
+                            help='Write the network of every point of the threshold sweep')
+
+# Arguments of the interaction and network analysis in one process
+pipeline_parser = argparse.ArgumentParser(add_help=False, parents=[analysis_parser])
+pipeline_parser.add_argument('-i', dest='input', type=str,
+                             help='Input microbial feature table')
+pipeline_parser.add_argument('-o', dest='output', type=str, default='network.xml',
+                             help='Output network file (default: %(default)s)')
+pipeline_parser.add_argument('--results', dest='results', type=str, default=None,
+                             help='Output interaction analysis result file (optional; required by --resume)')
+pipeline_parser.add_argument('--fdr-cooccurrence', dest='fdr_co', default=0.05, type=float,
+                             help='FDR of coocurrence analysis (default: %(default)s)')
+pipeline_parser.add_argument('--cooccurrence-type', dest='co_type', default='positive', type=str,
+                             help='Association type (default: %(default)s)')
+pipeline_parser.add_argument('--fdr-quantitative', dest='fdr_qt', default=0.05, type=float,
+                             help='FDR of quantitative analysis (Pearson\'s correlation) (default: %(default)s)')
+pipeline_parser.add_argument('--quantitative-type', dest='qt_type', default='positive', type=str,
+                             help='Association type (default: %(default)s)')
+pipeline_parser.add_argument('--format', dest='format', default=None, type=str, choices=NETWORK_FORMATS,
+                             help='Network file format (default: by the extension of the output file, or xgmml)')
+
+# Arguments of the logging and the metrics of all the sub-commands
+metrics_parser = argparse.ArgumentParser(add_help=False)
+metrics_parser.add_argument('--metrics', dest='metrics', type=str, default=None,
+                            help='Output JSON file of the metrics of the analysis stages (optional)')
+metrics_parser.add_argument('--log-level', dest='log_level', type=str, default='INFO',
+                            choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                            help='Level of the log messages (default: INFO)')
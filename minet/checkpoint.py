@@ -0,0 +1,94 @@
+"""
+Checkpoint module
+
+This module keeps the state of a running interaction analysis on disk so that interrupted runs can be resumed.
+
+Files in the checkpoint directory:
+
+- table.pkl: the preprocessed feature table
+- state.json: the analysis settings (including the random seed and the tile size), the completed pair tiles and the
+  size of the raw result file covering the completed tiles
+"""
+
+import json
+import os
+import shutil
+
+import pandas as pd
+
+
+class Checkpoint:
+    """
+    Handles the checkpoint directory of an interaction analysis.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the checkpoint in the directory path
+        """
+        self.path = path
+        self.state = None
+
+    def exists(self):
+        """
+        Checks whether a checkpoint was written
+        """
+        return os.path.exists(os.path.join(self.path, 'state.json'))
+
+    def create(self, table, settings):
+        """
+        Writes a new checkpoint with the preprocessed table and the analysis settings
+        """
+        os.makedirs(self.path, exist_ok=True)
+        table.to_pickle(os.path.join(self.path, 'table.pkl'))
+
+        self.state = {'settings': settings, 'completed': [], 'raw_size': 0}
+        self.save()
+
+    def load_table(self):
+        """
+        Loads the preprocessed table
+        """
+        return pd.read_pickle(os.path.join(self.path, 'table.pkl'))
+
+    def load(self):
+        """
+        Loads the state of the checkpoint
+        """
+        with open(os.path.join(self.path, 'state.json')) as f:
+            self.state = json.load(f)
+        return self.state
+
+    @property
+    def settings(self):
+        return self.state['settings']
+
+    @property
+    def completed(self):
+        """
+        Set of the completed tiles (i0, j0)
+        """
+        return set(tuple(t) for t in self.state['completed'])
+
+    def update(self, tiles, raw_size):
+        """
+        Records the tiles (i0, j0) whose results were written, and the size of the raw result file
+        """
+        self.state['completed'].extend([list(t) for t in tiles])
+        self.state['raw_size'] = raw_size
+        self.save()
+
+    def save(self):
+        """
+        Writes the state atomically
+        """
+        fn = os.path.join(self.path, 'state.json')
+        with open(fn + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(fn + '.tmp', fn)
+
+    def remove(self):
+        """
+        Removes the checkpoint directory
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -3,10 +3,23 @@ Co-occurrence evaulation module
 
 This module calculates the co-occurrence from the count vectors of two microbial profiles from two samples.
 
+The matrix functions evaluate all pairs of a feature table at once:
+
+- presence_counts: N12/N1/N2 from a presence-matrix product
+- fisher_pvalues: two-sided Fisher's exact p-values from vectorized hypergeometric computations
+- coocurrence_matrix: odds ratios and p-values matching coocurrence() for every pair
 """
 
 import numpy as np
-from scipy.stats import fisher_exact
+from scipy import sparse
+from scipy.stats import fisher_exact, hypergeom
+from minet.utility import LRUCache
+
+# Maximum number of memoized Fisher's exact p-values
+FISHER_CACHE_SIZE = 2**16
+
+# Fisher's exact p-values memoized by (n12, n1, n2, n)
+_FISHER_CACHE = LRUCache(FISHER_CACHE_SIZE)
 
 
 def coocurrence(v1, v2):
@@ -59,3 +72,209 @@ def coocurrence(v1, v2):
         odds_ratio = p12 / (p1 * p2)
 
     return odds_ratio, pv
+
+
+def presence_counts(table_a, table_b=None):
+    """
+    Counts co-occurrences for all pairs of features using a presence-matrix product.
+
+    Parameters:
+    table_a (np.ndarray or scipy.sparse matrix): Feature x sample count matrix.
+    table_b (np.ndarray or scipy.sparse matrix, optional): Second feature x sample count matrix. If None, table_a is used.
+
+    Returns:
+        n12 (np.ndarray): Number of samples where both features are present (table_a.shape[0] x table_b.shape[0]).
+        n1 (np.ndarray): Number of samples where each feature of table_a is present.
+        n2 (np.ndarray): Number of samples where each feature of table_b is present.
+    """
+    pa = _presence(table_a)
+    if table_b is None:
+        pb = pa
+    else:
+        pb = _presence(table_b)
+
+    n12 = pa @ pb.T
+    if sparse.issparse(n12):
+        n12 = n12.toarray()
+    n12 = np.rint(n12).astype(np.int64)
+    n1 = np.asarray(pa.sum(axis=1)).ravel().astype(np.int64)
+    n2 = np.asarray(pb.sum(axis=1)).ravel().astype(np.int64)
+    return n12, n1, n2
+
+
+def _presence(table):
+    """
+    Converts a count matrix (dense or sparse) into a presence/absence matrix of floats.
+    """
+    if sparse.issparse(table):
+        pt = sparse.csr_matrix(table, dtype=np.float64, copy=True)
+        pt.eliminate_zeros()
+        pt.data[:] = 1.
+        return pt
+    return (np.asarray(table) != 0).astype(np.float64)
+
+
+def odds_ratios(n12, n1, n2, n):
+    """
+    Calculates the likelihood ratio (odds ratio) of co-occurrence as in coocurrence().
+    """
+    n12, n1, n2 = np.broadcast_arrays(np.asarray(n12), np.asarray(n1), np.asarray(n2))
+
+    p1 = n1 / float(n)
+    p2 = n2 / float(n)
+    p12 = n12 / float(n)
+
+    odds_ratio = np.ones(n12.shape, dtype=float)
+    valid = (p1 != 0) & (p2 != 0)
+    odds_ratio[valid] = p12[valid] / (p1[valid] * p2[valid])
+    return odds_ratio
+
+
+def fisher_pvalues(n12, n1, n2, n):
+    """
+    Calculates two-sided p-values of Fisher's exact test for arrays of contingency tables.
+
+    Each table is given by the number of co-occurring cases (n12), the marginal counts (n1, n2) and the number of samples (n).
+    The p-values are identical to scipy.stats.fisher_exact. Unique tables are evaluated once with vectorized hypergeometric
+    computations and memoized by (n12, n1, n2, n) in a cache of the FISHER_CACHE_SIZE most recently used tables.
+    """
+    n12, n1, n2 = np.broadcast_arrays(np.asarray(n12, dtype=np.int64),
+                                      np.asarray(n1, dtype=np.int64),
+                                      np.asarray(n2, dtype=np.int64))
+    shape = n12.shape
+    n = int(n)
+
+    # Unique tables
+    keys = np.stack([n12.ravel(), n1.ravel(), n2.ravel()], axis=1)
+    if len(keys) == 0:
+        return np.ones(shape, dtype=float)
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+    pv = np.empty(len(keys), dtype=float)
+    missing = []
+    for i, (k, a, b) in enumerate(keys.tolist()):
+        p = _FISHER_CACHE.get((k, a, b, n))
+        if p is None:
+            missing.append(i)
+        else:
+            pv[i] = p
+
+    if missing:
+        missing = np.array(missing)
+        k, a, b = keys[missing, 0], keys[missing, 1], keys[missing, 2]
+        pv[missing] = _fisher_two_sided(k, a, b, n)
+        for (k, a, b), p in zip(keys[missing].tolist(), pv[missing].tolist()):
+            _FISHER_CACHE.put((k, a, b, n), p)
+
+    return pv[inverse.ravel()].reshape(shape)
+
+
+def coocurrence_matrix(table_a, table_b=None):
+    """
+    Co-occurrence evaluation for all pairs of features
+
+    Applies the co-occurrence evaluation of coocurrence() to every pair of rows (features) of the input feature tables.
+
+    Parameters:
+    table_a (np.ndarray or scipy.sparse matrix): Feature x sample count matrix.
+    table_b (np.ndarray or scipy.sparse matrix, optional): Second feature x sample count matrix. If None, table_a is used.
+
+    Returns:
+        n12 (np.ndarray): Number of co-occurring samples for each pair.
+        n1 (np.ndarray): Number of samples where the first feature is present.
+        n2 (np.ndarray): Number of samples where the second feature is present.
+        odds_ratio (np.ndarray): The observed frequency divided by the expected frequency of independent cases.
+        p_value (np.ndarray): The p-value from Fisher's exact test.
+    """
+    n = np.shape(table_a)[1]
+    n12, n1, n2 = presence_counts(table_a, table_b)
+    n1, n2 = np.broadcast_arrays(n1[:, None], n2[None, :])
+
+    odds_ratio = odds_ratios(n12, n1, n2, n)
+    pv = fisher_pvalues(n12, n1, n2, n)
+    return n12, n1, n2, odds_ratio, pv
+
+
+def _fisher_two_sided(n12, n1, n2, n):
+    """
+    Vectorized two-sided Fisher's exact test following scipy.stats.fisher_exact.
+
+    The contingency table [[n12, n1 - n12], [n2 - n12, n - n1 - n2 + n12]] follows a hypergeometric
+    distribution with n samples, n1 successes and n2 draws.
+    """
+    pv = np.ones(len(n12), dtype=float)
+
+    # Tables with an empty row or column
+    valid = (n1 > 0) & (n1 < n) & (n2 > 0) & (n2 < n)
+    if not np.any(valid):
+        return pv
+    k, a, b = n12[valid], n1[valid], n2[valid]
+    res = np.ones(len(k), dtype=float)
+
+    mode = ((b + 1) * (a + 1)) // (n + 2)
+    pexact = hypergeom.pmf(k, n, a, b)
+    pmode = hypergeom.pmf(mode, n, a, b)
+
+    epsilon = 1e-14
+    gamma = 1 + epsilon
+
+    at_mode = np.abs(pexact - pmode) / np.maximum(pexact, pmode) <= epsilon
+
+    # Lower tail plus the upper tail with smaller probabilities
+    lower = ~at_mode & (k < mode)
+    if np.any(lower):
+        kl, al, bl = k[lower], a[lower], b[lower]
+        d = pexact[lower] * gamma
+        guess = _binary_search(lambda x, s: -hypergeom.pmf(x, n, al[s], bl[s]),
+                               -d, mode[lower], bl)
+        plower = hypergeom.cdf(kl, n, al, bl)
+        pupper = np.where(hypergeom.pmf(bl, n, al, bl) > d, 0.,
+                          hypergeom.sf(guess, n, al, bl))
+        res[lower] = plower + pupper
+
+    # Upper tail plus the lower tail with smaller probabilities
+    upper = ~at_mode & (k >= mode)
+    if np.any(upper):
+        ku, au, bu = k[upper], a[upper], b[upper]
+        d = pexact[upper] * gamma
+        guess = _binary_search(lambda x, s: hypergeom.pmf(x, n, au[s], bu[s]),
+                               d, np.zeros(len(ku), dtype=np.int64), mode[upper])
+        pupper = hypergeom.sf(ku - 1, n, au, bu)
+        plower = np.where(hypergeom.pmf(0, n, au, bu) > d, 0.,
+                          hypergeom.cdf(guess, n, au, bu))
+        res[upper] = pupper + plower
+
+    pv[valid] = np.minimum(res, 1.0)
+    return pv
+
+
+def _binary_search(f, d, lo, hi):
+    """
+    Vectorized binary search of scipy.stats.fisher_exact.
+
+    Finds i between lo and hi such that f(i) <= d < f(i + 1) for every element.
+    f(x, s) evaluates the function at x for the elements selected by the boolean mask s.
+    """
+    lo = np.array(lo, dtype=np.int64)
+    hi = np.array(hi, dtype=np.int64)
+    res = np.zeros(len(lo), dtype=np.int64)
+    found = np.zeros(len(lo), dtype=bool)
+
+    active = lo < hi
+    while np.any(active):
+        mid = lo[active] + (hi[active] - lo[active]) // 2
+        midval = f(mid, active)
+        di = d[active]
+
+        ix = np.nonzero(active)[0]
+        lo[ix[midval < di]] = mid[midval < di] + 1
+        hi[ix[midval > di]] = mid[midval > di] - 1
+        res[ix[midval == di]] = mid[midval == di]
+        found[ix[midval == di]] = True
+
+        active = (lo < hi) & ~found
+
+    rest = ~found
+    if np.any(rest):
+        res[rest] = np.where(f(lo[rest], rest) <= d[rest], lo[rest], lo[rest] - 1)
+    return res
@@ -18,14 +18,35 @@ Edges:
 
 import os
 import sys
+from xml.sax.saxutils import escape
 
 VERBOSE = True
 
 
+def _quote(value):
+    """
+    Escapes a value of an XML attribute
+    """
+    return escape(str(value), {'"': '&quot;'})
+
+
+def _att(name, value):
+    """
+    Creates the att element of a property
+    """
+    if type(value) == type(0):  # integer
+        return '<att name=\"%s\" type=\"integer\" value=\"%d\"/>\n' % (_quote(name), int(value))
+    elif type(value) == type(1.0):  # float
+        return '<att name=\"%s\" type=\"real\" value=\"%f\"/>\n' % (_quote(name), value)
+    else:
+        return '<att name=\"%s\" type=\"string\" value=\"%s\"/>\n' % (_quote(name), _quote(value))
+
+
 class CytNode:
     """
     Represents a node of the interaction network.
     """
+    __slots__ = ('nid', 'properties')
 
     def __init__(self, nid, properties):
         """
@@ -39,6 +60,7 @@ class CytEdge:
     """
     Represents an edge of the interaction network.
     """
+    __slots__ = ('nid1', 'nid2', 'properties')
 
     def __init__(self, nid1, nid2, properties):
         """
@@ -62,16 +84,22 @@ class CytGraph:
         self.Nodes = []
         self.Edges = []
 
-        self.node_set = set()
+        # Internal indices of the nodes and the edges
+        self.node_index = {}
+        self.edge_index = {}
 
     def print_graph(self):
         """
         Prints the graph into XGMML format.
         """
-        line = ''
+        return ''.join(self.iter_graph())
 
+    def iter_graph(self):
+        """
+        Generates the lines of the graph in XGMML format.
+        """
         # The header for the graph
-        line += "<graph directed=\"1\" id=\"42\" label=\"%s\" xmlns=\"http://www.cs.rpi.edu/XGMML\">\n" % self.GraphName
+        yield "<graph directed=\"1\" id=\"42\" label=\"%s\" xmlns=\"http://www.cs.rpi.edu/XGMML\">\n" % _quote(self.GraphName)
 
         # Node elements
         for n in self.Nodes:
@@ -79,21 +107,10 @@ class CytGraph:
                 label = n.properties['label']
             else:
                 label = n.nid
-            line += '<node id=\"%s\" label=\"%s\">\n' % (n.nid, label)
+            yield '<node id=\"%s\" label=\"%s\">\n' % (_quote(n.nid), _quote(label))
             for p in n.properties:
-                p = p.lower()
-
-                if type(n.properties[p]) == type(0):  # integer
-                    line += '<att name=\"%s\" type=\"integer\" value=\"%d\"/>\n' % (
-                        p, int(n.properties[p]))
-                elif type(n.properties[p]) == type(1.0):  # float
-                    line += '<att name=\"%s\" type=\"real\" value=\"%f\"/>\n' % (
-                        p, n.properties[p])
-                else:
-                    line += '<att name=\"%s\" type=\"string\" value=\"%s\"/>\n' % (
-                        p, n.properties[p])
-
-            line += '</node>\n'
+                yield _att(p.lower(), n.properties[p])
+            yield '</node>\n'
 
         # Edge elements
         for e in self.Edges:
@@ -101,27 +118,14 @@ class CytGraph:
                 label = e.properties['label']
             else:
                 label = 'gg'
-            line += '<edge source=\"%s\" target=\"%s\" label=\"%s\">\n' % (
-                e.nid1, e.nid2, label)
-
+            yield '<edge source=\"%s\" target=\"%s\" label=\"%s\">\n' % (
+                _quote(e.nid1), _quote(e.nid2), _quote(label))
             for p in e.properties:
-
-                if type(e.properties[p]) == type(0):  # integer
-                    line += '<att name=\"%s\" type=\"integer\" value=\"%d\"/>\n' % (
-                        p, int(e.properties[p]))
-                elif type(e.properties[p]) == type(1.0):  # float
-                    line += '<att name=\"%s\" type=\"real\" value=\"%f\"/>\n' % (
-                        p, e.properties[p])
-                else:
-                    line += '<att name=\"%s\" type=\"string\" value=\"%s\"/>\n' % (
-                        p, e.properties[p])
-
-            line += '</edge>\n'
+                yield _att(p, e.properties[p])
+            yield '</edge>\n'
 
         # Footer of the graph
-        line += "</graph>\n"
-
-        return line
+        yield "</graph>\n"
 
     def add_node(self, nid, properties):
         """
@@ -132,16 +136,22 @@ class CytGraph:
         """
         global VERBOSE
 
-        j = self.get_node_index(nid)
-        if j == -1:  # not found
+        if nid not in self.node_index:  # not found
+            self.node_index[nid] = len(self.Nodes)
             self.Nodes.append(CytNode(nid, properties))
-            self.node_set.add(nid)
         else:
             if VERBOSE:
                 print('Warning: the node %s is already present' % nid)
                 print(
                     '         the following properties will not be added:', str(properties))
 
+    def add_nodes(self, nodes):
+        """
+        Adds nodes to the graph from (node index, properties) pairs
+        """
+        for nid, properties in nodes:
+            self.add_node(nid, properties)
+
     def add_edge(self, nid1, nid2, properties):
         """
         Adds an edge to the graph
@@ -150,12 +160,9 @@ class CytGraph:
         2. Add a new edge if not present in the graph
         """
         global VERBOSE
-        if nid1 in self.node_set and nid2 in self.node_set:
-            j1 = self.get_node_index(nid1)
-            j2 = self.get_node_index(nid2)
-
-            je = self.get_edge_index(nid1, nid2)
-            if je == -1:  # not found
+        if nid1 in self.node_index and nid2 in self.node_index:
+            if (nid1, nid2) not in self.edge_index:  # not found
+                self.edge_index[(nid1, nid2)] = len(self.Edges)
                 self.Edges.append(CytEdge(nid1, nid2, properties))
             else:
                 if VERBOSE:
@@ -166,24 +173,24 @@ class CytGraph:
             print('Warning: the nodes in the edge not found.')
             print('         this edge will not be added: (%s, %s)' % (nid1, nid2))
 
+    def add_edges(self, edges):
+        """
+        Adds edges to the graph from (node index 1, node index 2, properties) triples
+        """
+        for nid1, nid2, properties in edges:
+            self.add_edge(nid1, nid2, properties)
+
     def get_node_index(self, nid):
         """
         Retrieves the internal node index corresponding to the given node index.
         """
-        for i, n in enumerate(self.Nodes):
-            if nid == n.nid:
-                return i
-        return -1
+        return self.node_index.get(nid, -1)
 
     def get_edge_index(self, nid1, nid2):
         """
         Retrieves the internal edge index corresponding to the given edge indices.
         """
-        for i, e in enumerate(self.Edges):
-            if e.nid1 == nid1 and e.nid2 == nid2:
-                return i
-        else:
-            return -1
+        return self.edge_index.get((nid1, nid2), -1)
 
 
 class CytoscapeXGMML:
@@ -205,6 +212,12 @@ class CytoscapeXGMML:
         nid = str(nid)
         self.Graph.add_node(nid, properties)
 
+    def add_nodes(self, nodes):
+        """
+        Adds new nodes to the graph from (node index, properties) pairs
+        """
+        self.Graph.add_nodes((str(nid), properties) for nid, properties in nodes)
+
     def add_edge(self, nid1, nid2, properties={}):
         """
         Adds a new edge to the graph
@@ -213,23 +226,34 @@ class CytoscapeXGMML:
         nid2 = str(nid2)
         self.Graph.add_edge(nid1, nid2, properties)
 
+    def add_edges(self, edges):
+        """
+        Adds new edges to the graph from (node index 1, node index 2, properties) triples
+        """
+        self.Graph.add_edges((str(nid1), str(nid2), properties) for nid1, nid2, properties in edges)
+
     def print_graph(self):
         """
         Convert graph into XML (text).
         """
-        lines = self.Header[:]
-        lines += self.Graph.print_graph()
+        return ''.join(self.iter_graph())
 
-        return lines
+    def iter_graph(self):
+        """
+        Generates the lines of the graph in XML (text).
+        """
+        yield self.Header
+        yield from self.Graph.iter_graph()
 
     def write_graph(self, fn):
         """
-        Write the graph into a file
+        Write the graph into a file (a file name or a text file object)
         """
-        ls = self.print_graph()
-        f = open(fn, 'w')
-        f.write(ls)
-        f.close()
+        if hasattr(fn, 'write'):
+            fn.writelines(self.iter_graph())
+        else:
+            with open(fn, 'w', buffering=2**20) as f:
+                f.writelines(self.iter_graph())
 
     def turn_off_warning(self):
         global VERBOSE
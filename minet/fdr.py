@@ -2,12 +2,40 @@
 This module facilitate evaluation of statistical significance for multiple test cases by controling the false discovery rate.
 
 The FDR class handles a DataFrame object and calculates adjusted p-values for individual tests.
+Several p-value columns can be adjusted at once, either in a DataFrame (FDR.adjust) or in result files read in chunks
+(FDR.adjust_files), so that the adjustment never needs the whole results as a DataFrame.
 """
 
+import numpy as np
 import pandas as pd
 from statsmodels.stats import multitest
 
 
+def bh_adjust(pvalues, out=None):
+    """
+    Adjusts p-values by the Benjamini-Hochberg procedure (the same values as multitest.multipletests(method='fdr_bh'))
+
+    Parameters:
+    pvalues (np.ndarray): P-values.
+    out (np.ndarray, optional): Preallocated array of the adjusted p-values.
+
+    Returns:
+    np.ndarray: The adjusted p-values (out).
+    """
+    pvalues = np.asarray(pvalues, dtype=float)
+    if out is None:
+        out = np.empty_like(pvalues)
+
+    n = len(pvalues)
+    order = np.argsort(pvalues)
+    adjusted = pvalues[order]
+    adjusted /= np.arange(1, n + 1) / float(n)
+    np.minimum.accumulate(adjusted[::-1], out=adjusted[::-1])
+    adjusted[adjusted > 1] = 1
+    out[order] = adjusted
+    return out
+
+
 class FDR:
     """
     Handles multiple test results to calculate adjusted p-values, thereby controlling the false discovery rate (FDR). 
@@ -70,3 +98,58 @@ class FDR:
         # Concatenate the original DataFrame with the results
         res = pd.concat([data, df], axis=1)
         return res, df
+
+    def adjust(self, data, pvalue_columns, adjusted_columns=None):
+        """
+        Adds the adjusted p-values of several p-value columns to the DataFrame in place.
+
+        Parameters:
+        data (pd.DataFrame): Input data containing p-values.
+        pvalue_columns (list): Column names of the p-values.
+        adjusted_columns (list, optional): Column names of the adjusted p-values (default: 'Adjusted-P(<column>)').
+
+        Returns:
+        pd.DataFrame: The input DataFrame with the adjusted p-values.
+        """
+        if not isinstance(data, pd.DataFrame):
+            raise TypeError('Input data should be pandas.DataFrame type.')
+
+        adjusted_columns = adjusted_columns or ['Adjusted-P(%s)' % c for c in pvalue_columns]
+        out = np.empty((len(pvalue_columns), len(data)))
+        for k, c in enumerate(pvalue_columns):
+            bh_adjust(data[c].values, out=out[k])
+            data[adjusted_columns[k]] = out[k]
+        return data
+
+    def adjust_files(self, filenames, output, pvalue_columns, adjusted_columns=None, chunksize=1000000, **kwargs):
+        """
+        Writes the rows of the result files with the adjusted p-values of several p-value columns to the output file.
+
+        Only the p-value columns are read at once; the rows are read and written in chunks of chunksize rows,
+        in the order of the files. kwargs are passed to pd.read_csv (sep='\\t' by default).
+
+        Returns:
+        int: The number of rows.
+        """
+        adjusted_columns = adjusted_columns or ['Adjusted-P(%s)' % c for c in pvalue_columns]
+        kwargs = dict({'sep': '\t'}, **kwargs)
+        index_col = kwargs.pop('index_col', None)
+
+        pvalues = [pd.read_csv(f, usecols=pvalue_columns, **kwargs)[pvalue_columns].values for f in filenames]
+        pvalues = np.concatenate(pvalues) if pvalues else np.zeros((0, len(pvalue_columns)))
+        adjusted = np.empty(pvalues.shape[::-1])
+        for k in range(len(pvalue_columns)):
+            bh_adjust(pvalues[:, k], out=adjusted[k])
+        del pvalues
+
+        n = 0
+        header = True
+        with open(output, 'w') as f:
+            for filename in filenames:
+                for chunk in pd.read_csv(filename, index_col=index_col, chunksize=chunksize, **kwargs):
+                    for k, c in enumerate(adjusted_columns):
+                        chunk[c] = adjusted[k, n:n + len(chunk)]
+                    chunk.to_csv(f, sep=kwargs['sep'], header=header, index=index_col is not None)
+                    header = False
+                    n += len(chunk)
+        return n
@@ -0,0 +1,270 @@
+"""
+Feature table handling module
+
+This module reads microbial feature tables (features x samples) into dense or sparse DataFrames.
+Sparse tables are pandas DataFrames with sparse columns, and their numeric data are handled as scipy.sparse matrices.
+
+Parsed and preprocessed tables can be cached in a binary format (see save_binary and TableCache), keyed by the content
+hash of the text file, so that later runs memory-map the count matrix instead of parsing and preprocessing it again.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+# Default directory of the binary tables
+CACHE_DIR = os.environ.get('MINET_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'minet'))
+
+# Content hashes of the files by (path, size, modification time)
+_HASHES = {}
+
+
+class TableCache:
+    """
+    Directory of binary feature tables with a size cap
+
+    The tables are stored in cache_dir/<kind>/<key> (see save_binary). When the total size exceeds max_size (bytes),
+    the least recently used tables are removed.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def path(self, kind, key):
+        return os.path.join(self.cache_dir, kind, key)
+
+    def get(self, kind, key):
+        """
+        Loads a table, or returns None if the table is not in the cache
+        """
+        path = self.path(kind, key)
+        try:
+            # The modification time of meta.json is the last use of the table
+            os.utime(os.path.join(path, 'meta.json'))
+        except FileNotFoundError:
+            return None
+        logger.info('Loading the binary table %s', path)
+        return load_binary(path)
+
+    def put(self, kind, key, table):
+        """
+        Saves a table and removes the least recently used tables beyond the size cap
+        """
+        save_binary(table, self.path(kind, key))
+        self.evict(keep=self.path(kind, key))
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used tables until the cache fits into max_size, except the table at keep
+        """
+        if self.max_size is None:
+            return
+
+        entries = []
+        for kind in os.listdir(self.cache_dir):
+            for key in os.listdir(os.path.join(self.cache_dir, kind)):
+                path = os.path.join(self.cache_dir, kind, key)
+                try:
+                    last_used = os.stat(os.path.join(path, 'meta.json')).st_mtime
+                    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                except FileNotFoundError:
+                    # Partially written or removed by another process
+                    continue
+                entries.append((last_used, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path != keep:
+                logger.info('Removing the binary table %s', path)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+def read_table(filename, sparse_table=False, chunk_values=2**24, cache=None):
+    """
+    Reads a feature table (.tsv)
+
+    With sparse_table, the table is read in chunks of about chunk_values values, which are converted into sparse matrices,
+    so that the dense table is never held in memory.
+
+    With cache (TableCache), the table is loaded from its binary copy if the same content was read before,
+    and the binary copy is written otherwise.
+    """
+    if cache is not None:
+        key = file_hash(filename) + ('.sparse' if sparse_table else '.dense')
+        table = cache.get('tables', key)
+        if table is None:
+            table = read_table(filename, sparse_table=sparse_table, chunk_values=chunk_values)
+            cache.put('tables', key, table)
+        return table
+
+    if not sparse_table:
+        return pd.read_csv(filename, sep='\t', header=0, index_col=0)
+
+    header = pd.read_csv(filename, sep='\t', header=0, index_col=0, nrows=0)
+    chunksize = max(1, chunk_values // max(1, len(header.columns)))
+
+    blocks = []
+    index = []
+    for chunk in pd.read_csv(filename, sep='\t', header=0, index_col=0, chunksize=chunksize):
+        blocks.append(sparse.csr_matrix(chunk.values))
+        index.extend(chunk.index)
+
+    if blocks:
+        matrix = sparse.vstack(blocks).tocsr()
+    else:
+        matrix = sparse.csr_matrix((0, len(header.columns)))
+    return from_matrix(matrix, pd.Index(index, name=header.index.name), header.columns)
+
+
+def file_hash(filename, chunk_size=2**24):
+    """
+    Calculates the content hash (hex digest) of a file
+
+    The hash is reused while the size and the modification time of the file are unchanged.
+    """
+    st = os.stat(filename)
+    stamp = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    if stamp not in _HASHES:
+        h = hashlib.blake2b(digest_size=20)
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        _HASHES[stamp] = h.hexdigest()
+    return _HASHES[stamp]
+
+
+def save_binary(table, path):
+    """
+    Saves a feature table in the binary format
+
+    The binary table is a directory of .npy files: the count matrix (counts.npy, or data.npy, indices.npy and indptr.npy
+    of a CSR matrix for sparse tables), the feature and sample IDs (features.npy, samples.npy) and meta.json.
+    Integer counts are stored with the smallest unsigned integer type holding them.
+    The directory is written under a temporary name and renamed, so that a partially written table is never loaded.
+    """
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    if is_sparse(table):
+        matrix = feature_matrix(table, dtype=table.dtypes.iloc[0].subtype)
+        arrays = {'data': _compact(matrix.data), 'indices': matrix.indices, 'indptr': matrix.indptr}
+    else:
+        arrays = {'counts': _compact(table.values)}
+    arrays['features'] = _labels(table.index)
+    arrays['samples'] = _labels(table.columns)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), array, allow_pickle=False)
+    meta = {'format': 'sparse' if is_sparse(table) else 'dense',
+            'shape': list(table.shape),
+            'index_name': table.index.name}
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # The same table was saved by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_binary(path):
+    """
+    Loads a feature table saved by save_binary
+
+    The count matrix of a dense table is memory-mapped rather than read into memory.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    index = pd.Index(np.load(os.path.join(path, 'features.npy')), name=meta['index_name'])
+    columns = pd.Index(np.load(os.path.join(path, 'samples.npy')))
+    if meta['format'] == 'sparse':
+        matrix = sparse.csr_matrix((np.load(os.path.join(path, 'data.npy'), mmap_mode='r'),
+                                    np.load(os.path.join(path, 'indices.npy'), mmap_mode='r'),
+                                    np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')),
+                                   shape=tuple(meta['shape']))
+        return from_matrix(matrix, index, columns)
+
+    counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+    return pd.DataFrame(counts, index=index, columns=columns, copy=False)
+
+
+def _compact(values):
+    """
+    Converts non-negative integer counts to the smallest unsigned integer type holding them
+    """
+    values = np.asarray(values)
+    if values.size == 0 or not np.issubdtype(values.dtype, np.number) or values.min() < 0 \
+            or not np.array_equal(values, np.floor(values)):
+        return values
+    for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+        if values.max() <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+
+
+def _labels(index):
+    """
+    Converts the IDs to an array saved without pickling
+    """
+    labels = np.asarray(index)
+    if labels.dtype == object:
+        labels = labels.astype(str)
+    return labels
+
+
+def is_sparse(table):
+    """
+    Checks whether all columns of the table are sparse
+    """
+    return len(table.columns) > 0 and all(isinstance(t, pd.SparseDtype) for t in table.dtypes)
+
+
+def feature_matrix(table, dtype=float):
+    """
+    Returns the numeric data of the table: a CSR matrix for sparse tables or a numpy array
+    """
+    if is_sparse(table):
+        matrix = table.sparse.to_coo().tocsr().astype(dtype)
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        return matrix
+    return table.values.astype(dtype)
+
+
+def from_matrix(matrix, index, columns):
+    """
+    Creates a sparse table from a scipy.sparse matrix
+
+    The columns are sparse arrays with zero as the fill value.
+    """
+    matrix = sparse.csc_matrix(matrix)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    data = {k: pd.arrays.SparseArray.from_spmatrix(matrix[:, [k]]) for k in range(matrix.shape[1])}
+    table = pd.DataFrame(data, index=index)
+    table.columns = columns
+    return table
+
+
+def row(matrix, i):
+    """
+    Returns the i-th row of a dense or sparse matrix as a dense vector
+    """
+    if sparse.issparse(matrix):
+        return matrix[i].toarray().ravel()
+    return np.asarray(matrix[i])
@@ -5,31 +5,41 @@ This module evaluates the pairwise interactions of microbes from microbial featu
 It performs co-occurrence analysis, qualitative assessment of co-occurring microbes, and inference of interaction directionality.
 """
 
-import argparse
+import hashlib
 import logging
+import os
+import time
 
 import psutil
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
-from scipy.stats import pearsonr
-from minet import utility, fdr, cooccurrence, preprocess
+from scipy.stats import beta, hypergeom
+from scipy import sparse
+from minet import arguments, utility, fdr, cooccurrence, quantitative, preprocess, writer, checkpoint, feature_table
+from minet.metrics import Metrics
 
 # Create a logger
 logger = logging.getLogger(__name__)
 
-# Arguments
-parser = argparse.ArgumentParser(add_help=False)
-parser.add_argument('-i', dest='input', type=str,
-                    help='Input microbial feature table')
-parser.add_argument('-o', dest='output', type=str,
-                    help='Output interaction analysis result file')
-parser.add_argument('--depth', dest='depth', type=int, default=10000,
-                    help='Per sample read depth cutoff (default: %(default)s)')
-parser.add_argument('--prevalence', dest='prevalence', type=float, default=0.1,
-                    help='Per ASV prevalence cutoff (default: %(default)s)')
-parser.add_argument('--no-preprocess', dest='no_preprocess', action='store_true', default=False,             
-                    help='User this flag for preprocessed input data')
+# Arguments (see arguments)
+analysis_parser = arguments.analysis_parser
+parser = arguments.interaction_parser
+merge_parser = arguments.merge_parser
+
+# Columns of the interaction analysis results
+RESULT_COLUMNS = ['Feature1', 'Feature2',
+                  'N12', 'N1', 'N2', 'LogOddsRatio', 'Rho',
+                  'P-value(FisherExact)', 'P-value(Pearson)',
+                  'LogRatio12', 'LogRatio21',
+                  'P-value(12)', 'P-value(21)']
+
+# Settings of the feature table kept in the checkpoint (see Analyzer.load_checkpoint)
+TABLE_SETTINGS = ['input_hash', 'depth', 'prevalence', 'preprocessing']
+
+# Approximate working memory per pair of a tile and per feature x sample value of a tile (bytes)
+BYTES_PER_PAIR = 512
+BYTES_PER_VALUE = 96
 
 
 class Analyzer:
@@ -37,145 +47,633 @@ class Analyzer:
     Manages statistical interactions of microbial features from the input microbial feature table.
     """
 
-    def __init__(self):
+    def __init__(self, metrics=None):
         """
         Initializes the analysis class
+
+        metrics: the metrics.Metrics collecting the measurements of the stages (a new one if None)
         """
-        pass
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.table_settings = {}
 
-    def load_feature_table(self, filename, depth=10000, prevalence=0.1, preprocessing=True):
+    def load_feature_table(self, filename, depth=10000, prevalence=0.1, preprocessing=True, seed=None, sparse_table=False,
+                           cache_dir=None, cache_size=None):
         """
         Loads data from the microbial feature table 
+
+        seed: random seed of the undersampling (random if None)
+        sparse_table: loads and preprocesses the table as a sparse matrix
+        cache_dir: directory of the binary copies of the parsed and preprocessed tables (not cached if None)
+        cache_size: size cap of cache_dir in MB; the least recently used tables are removed beyond the cap
+
+        The preprocessed tables are cached by the content of the file, depth, prevalence and seed,
+        so they are only cached with a seed.
         """
-        self.asv_table = pd.read_csv(filename, sep='\t', header=0, index_col=0)
-        print(self.asv_table.shape)
+        table_settings = {'input_hash': feature_table.file_hash(filename), 'depth': depth, 'prevalence': prevalence,
+                          'preprocessing': preprocessing}
+        cache = None
+        if cache_dir is not None:
+            cache = feature_table.TableCache(cache_dir, None if cache_size is None else cache_size * 2**20)
+
+        key = None
+        if cache is not None and preprocessing and seed is not None:
+            key = preprocess.cache_key(table_settings['input_hash'], depth, prevalence, seed) + \
+                ('.sparse' if sparse_table else '.dense')
+            with self.metrics.stage('load_cache') as record:
+                self.asv_table = cache.get('preprocessed', key)
+                record['hit'] = self.asv_table is not None
+                if self.asv_table is not None:
+                    record.update(features=self.asv_table.shape[0], samples=self.asv_table.shape[1])
+            if self.asv_table is not None:
+                self.table_settings = table_settings
+                return
+
+        with self.metrics.stage('load_table') as record:
+            self.asv_table = feature_table.read_table(filename, sparse_table=sparse_table, cache=cache)
+            record.update(features=self.asv_table.shape[0], samples=self.asv_table.shape[1])
+
+        if preprocessing:
+            self.set_feature_table(self.asv_table, depth, prevalence, preprocessing, seed)
+            if key is not None:
+                cache.put('preprocessed', key, self.asv_table)
+        self.table_settings = table_settings
 
+    def set_feature_table(self, table, depth=10000, prevalence=0.1, preprocessing=True, seed=None):
+        """
+        Sets the feature table from a DataFrame (features x samples) and preprocesses it (see load_feature_table)
+        """
+        self.asv_table = table
+        self.table_settings = {'input_hash': None, 'depth': depth, 'prevalence': prevalence,
+                               'preprocessing': preprocessing}
         if preprocessing:
-            pr = preprocess.Preprocessor(self.asv_table)
-            pr.undersampling_by_depth(depth)
-            pr.filter_by_prevalence(prevalence)
+            with self.metrics.stage('preprocess', depth=depth, prevalence=prevalence) as record:
+                pr = preprocess.Preprocessor(self.asv_table, seed=seed)
+                pr.undersampling_by_depth(depth)
+                pr.filter_by_prevalence(prevalence)
+                self.asv_table = pr.table
+                record.update(features=self.asv_table.shape[0], samples=self.asv_table.shape[1])
+
+    def load_checkpoint(self, output, filename=None, depth=None, prevalence=None, preprocessing=None):
+        """
+        Loads the preprocessed feature table from the checkpoint of the output file
 
-            self.asv_table = pr.table
-            print(self.asv_table.shape)
+        The feature table file (by its content), depth, prevalence and preprocessing that are given should be those
+        of the checkpoint (see load_feature_table); a ValueError is raised otherwise.
 
-    def evaluate_feature_association(self, output):
+        Returns False if there is no checkpoint.
+        """
+        ckpt = checkpoint.Checkpoint(output + '.checkpoint')
+        if not ckpt.exists():
+            return False
+        ckpt.load()
+        given = {'input_hash': None if filename is None else feature_table.file_hash(filename), 'depth': depth,
+                 'prevalence': prevalence, 'preprocessing': preprocessing}
+        for key in TABLE_SETTINGS:
+            if given[key] is not None and ckpt.settings.get(key) != given[key]:
+                raise ValueError('The checkpoint was created with a different %s: %s' % (key, ckpt.settings.get(key)))
+        self.table_settings = {key: ckpt.settings.get(key) for key in TABLE_SETTINGS}
+        self.asv_table = ckpt.load_table()
+        logger.info('Feature table from the checkpoint: %d features x %d samples', *self.asv_table.shape)
+        return True
+
+    def evaluate_feature_association(self, output, engine='matrix', directionality='permutation', null_cache_size=0,
+                                     max_memory=1024, seed=None, resume=False, checkpoint_interval=300, prescreen=None,
+                                     shard=None, sequential=None):
         """
         Evaluate the interactions for all microbial interactions 
+
+        engine: 'matrix' calculates the co-occurrence and quantitative association of all pairs at once, and 'pair' calculates them for each pair in the workers.
+        directionality: 'permutation' evaluates the directionality by permutation tests, 'exact' by the hypergeometric distribution, and 'sequential' by sequential permutation tests.
+        null_cache_size: the number of permutation null distributions cached by marginal counts (0: no cache)
+        max_memory: the working memory budget of the workers (MB) to determine the size of the pair tiles
+        seed: the random seed of the permutation tests (random if None)
+        resume: skips the pair tiles completed in the checkpoint of the output file
+        checkpoint_interval: the seconds between checkpoints
+        prescreen: the p-value cutoff of the prescreen (see prescreen_mask; no prescreen if None)
+        shard: evaluates the k-th of n slices of the pairs (k, n) and writes the unadjusted results (see merge_results)
+        sequential: the keyword arguments of sequential_pvalue (cutoff, max_permutations, exceedances)
+
+        The checkpoint (<output>.checkpoint) holds the preprocessed table, the seed, the tile size and the completed tiles
+        whose results are in the raw result file (<output>.raw.tsv). Both are removed when the analysis is completed.
+        A resumed analysis should have the settings of the checkpoint (including those of the feature table, see
+        load_checkpoint, and the seed if given); a ValueError is raised otherwise.
+        Without an output file (None), the results are kept in memory and the analysis cannot be resumed.
+        With an output file, the raw results are sorted (see sort_results) and adjusted (see FDR.adjust_files) in
+        chunks, so the results are never read at once.
+
+        Returns the results as a DataFrame (see RESULT_COLUMNS) without an output file, and None otherwise.
         """
         self.output = output
 
-        ix_list = self.asv_table.index.values
+        if output is None and resume:
+            raise ValueError('An analysis without an output file cannot be resumed')
+
+        if directionality not in ('permutation', 'exact', 'sequential'):
+            raise ValueError('Unknown directionality method: %s' % directionality)
+
+        if engine not in ('matrix', 'pair'):
+            raise ValueError('Unknown engine: %s' % engine)
 
-        job_list = []
-        cnt = 1
-        for i, ix1 in enumerate(ix_list):
-            for j, ix2 in enumerate(ix_list):
-                if i > j:
-                    job_list.append([ix1, ix2,
-                                     self.asv_table.loc[ix1, :].values,
-                                     self.asv_table.loc[ix2, :].values, cnt])
-                    cnt += 1
-        print('Number of jobs:', len(job_list))
+        if prescreen is not None and not 0 < prescreen <= 1:
+            raise ValueError('The prescreen cutoff should be in (0, 1]: %s' % prescreen)
 
+        if shard is not None and seed is None:
+            raise ValueError('The shards should be evaluated with the same seed')
+
+        ix_list = self.asv_table.index.values
+        n_features = len(ix_list)
+        n_pairs = n_features * (n_features - 1) // 2
         nthreads = int(psutil.cpu_count())
-        jman = utility.Manager(job_permutation, nthreads)
-        jman.fill_jobs(job_list)
 
-        res = jman.analyze_result()
+        rows = (0, n_features)
+        if shard is not None:
+            rows = shard_rows(n_features, *shard)
+            n_pairs = (rows[1] * (rows[1] - 1) - rows[0] * (rows[0] - 1)) // 2
+
+        # Tiles of the pairs (i > j) fitting into the memory budget
+        size = tile_size(max_memory, self.asv_table.shape[1], nthreads)
+        # at least four tiles per worker
+        size = max(1, min(size, int(n_features / np.sqrt(8 * nthreads))))
+
+        # A given seed should be that of the checkpoint when resuming
+        checked = ['engine', 'directionality', 'sequential', 'prescreen', 'n_features', 'n_samples', 'shard'] + \
+            TABLE_SETTINGS + (['seed'] if seed is not None else [])
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+
+        sequential = dict(sequential or {}) if directionality == 'sequential' else None
+        if sequential is not None and sequential.get('exceedances', 1) < 1:
+            raise ValueError('The number of exceedances should be positive: %s' % sequential['exceedances'])
+
+        settings = {'engine': engine, 'directionality': directionality, 'sequential': sequential,
+                    'prescreen': prescreen, 'seed': seed,
+                    'tile_size': size, 'n_features': n_features, 'n_samples': self.asv_table.shape[1],
+                    'shard': None if shard is None else list(shard)}
+        settings.update({key: self.table_settings.get(key) for key in TABLE_SETTINGS})
+
+        # Raw results are written as the tiles finish, or kept in memory without an output file
+        results = []
+        raw_output = None if output is None else output + '.raw.tsv'
+        ckpt = None if output is None else checkpoint.Checkpoint(output + '.checkpoint')
+        if ckpt is None:
+            rw = None
+            completed = set()
+        elif resume and ckpt.exists():
+            ckpt.load()
+            for key in checked:
+                if ckpt.settings.get(key) != settings[key]:
+                    raise ValueError('The checkpoint was created with a different %s: %s'
+                                     % (key, ckpt.settings.get(key)))
+            seed = ckpt.settings['seed']
+            size = ckpt.settings['tile_size']
+            completed = ckpt.completed
+
+            with open(raw_output, 'r+') as f:
+                f.truncate(ckpt.state['raw_size'])
+            rw = writer.ResultWriter(raw_output, RESULT_COLUMNS, append=True)
+            logger.info('Resuming from %d completed tiles', len(completed))
+        else:
+            ckpt.create(self.asv_table, settings)
+            completed = set()
+
+            rw = writer.ResultWriter(raw_output, RESULT_COLUMNS)
+            ckpt.update([], rw.tell())
+
+        logger.info('Number of pairs: %d', n_pairs)
+        logger.info('Tile size: %d', size)
+
+        # Null distributions shared by the workers
+        null_cache = None
+        if directionality == 'permutation' and null_cache_size > 0:
+            cman = utility.CacheManager()
+            cman.start()
+            null_cache = cman.LRUCache(null_cache_size)
+
+        tiles = [t for t in pair_tiles(n_features, size, rows) if (t[0], t[2]) not in completed]
+        n_remaining = sum(tile_pairs(t) for t in tiles)
+
+        with self.metrics.stage('evaluation', pairs=n_remaining, tiles=len(tiles), workers=nthreads) as record:
+            t_start = time.perf_counter()
+
+            # Feature table shared by the workers
+            shared, table_spec = share_table(feature_table.feature_matrix(self.asv_table))
+            jman = utility.Manager(job_permutation, nthreads,
+                                   args=(table_spec, engine, directionality, null_cache, seed, prescreen, ix_list,
+                                         sequential))
+            progress = tqdm(total=n_pairs, initial=n_pairs - n_remaining, unit='pairs', disable=None)
+            busy = {}
+            n_pruned = 0
+            try:
+                # Checkpoints of the tiles whose results were written
+                written = []
+                t_checkpoint = time.time()
+                for tile, res, worker, seconds in jman.stream_jobs(tiles):
+                    busy[worker] = busy.get(worker, 0.) + seconds
+                    progress.update(len(res))
+                    self.metrics.sample_rss()
+                    if prescreen is not None:
+                        n_pruned += np.count_nonzero(prescreen_mask(res[:, 2], res[:, 7], prescreen))
+                    if rw is None:
+                        results.append(res)
+                        continue
+
+                    rw.write(result_table(res, ix_list))
+                    written.append((tile[0], tile[2]))
+                    if rw.n_buffered == 0 or time.time() - t_checkpoint > checkpoint_interval:
+                        rw.flush()
+                        ckpt.update(written, rw.tell())
+                        written = []
+                        t_checkpoint = time.time()
+                if rw is not None:
+                    rw.flush()
+                    ckpt.update(written, rw.tell())
+                if null_cache is not None:
+                    null_stats = null_cache.stats()
+            finally:
+                progress.close()
+                jman.terminate()
+                for sa in shared:
+                    sa.close()
+                if rw is not None:
+                    rw.close()
+                if null_cache is not None:
+                    cman.shutdown()
+
+            # Busy time of the workers over the wall time of the evaluation
+            elapsed = time.perf_counter() - t_start
+            record['worker_utilization'] = {str(w): t / elapsed for w, t in sorted(busy.items())}
+            record['mean_worker_utilization'] = sum(busy.values()) / (nthreads * elapsed)
+            record.update(jman.queue_stats)
+            if prescreen is not None:
+                logger.info('Pruned pairs: %d/%d', n_pruned, n_remaining)
+                record['pruned'] = n_pruned
+
+            if null_cache is not None:
+                logger.info('Null distribution cache: %d hits, %d misses, %d/%d entries',
+                            null_stats['hits'], null_stats['misses'], null_stats['size'], null_stats['maxsize'])
+                record['null_cache'] = null_stats
+
+        with self.metrics.stage('results', adjusted=shard is None) as record:
+            if rw is not None:
+                # The shards keep the unadjusted results for merge_results()
+                sorted_output = output if shard is not None else output + '.sorted.tsv'
+                record['pairs'] = sort_results(raw_output, sorted_output, ix_list)
+                if shard is None:
+                    fdr.FDR().adjust_files([sorted_output], output, ['P-value(FisherExact)', 'P-value(Pearson)'],
+                                           ['Adjusted-P(FisherExact)', 'Adjusted-P(Pearson)'], index_col=0,
+                                           float_precision='round_trip', dtype={'Feature1': str, 'Feature2': str})
+                    os.remove(sorted_output)
+                os.remove(raw_output)
+                ckpt.remove()
+                return None
+
+            df = result_table(np.concatenate(results) if results else np.zeros((0, len(RESULT_COLUMNS))), ix_list)
+            record['pairs'] = len(df)
+
+            # Sorts the pairs in the order of the feature table
+            pair_index = feature_pair_index(df, ix_list)
+            order = np.argsort(pair_index, kind='stable')
+            df = df.iloc[order].reset_index(drop=True)
+
+            if shard is None:
+                df = adjust_pvalues(df)
+            else:
+                df.index = pair_index[order]
+        return df
+
+
+def adjust_pvalues(df):
+    """
+    Adds the adjusted p-values of the Fisher's exact tests and the Pearson's correlations to the results in place
+    """
+    # False discovery rate calculation
+    return fdr.FDR().adjust(df, ['P-value(FisherExact)', 'P-value(Pearson)'],
+                            ['Adjusted-P(FisherExact)', 'Adjusted-P(Pearson)'])
+
+
+def feature_pair_index(df, ix_list):
+    """
+    Returns the indices of the pairs (Feature1, Feature2) of the results in the order of the features in ix_list
+
+    The features are matched by their names as strings, since the result files are read with string names
+    (see writer.read_results) while the feature IDs may be numbers.
+    """
+    pos = pd.Series(np.arange(len(ix_list)), index=pd.Index(ix_list).astype(str))
+    p1 = pos[df['Feature1'].astype(str)].values
+    p2 = pos[df['Feature2'].astype(str)].values
+    return p1 * (p1 - 1) // 2 + p2
 
-        # False discovery rate calculation
-        df = pd.DataFrame(res, columns=['Feature1', 'Feature2',
-                                        'N12', 'N1', 'N2', 'LogOddsRatio', 'Rho',
-                                        'P-value(FisherExact)', 'P-value(Pearson)',
-                                        'LogRatio12', 'LogRatio21',
-                                        'P-value(12)', 'P-value(21)'])
 
-        f = fdr.FDR()
-        df = f.calc(df, pvalue_index='P-value(FisherExact)')[0]
-        df.rename(
-            columns={'Adjusted-P': 'Adjusted-P(FisherExact)'}, inplace=True)
-        df.drop(columns=['Significance'], inplace=True)
-        df = f.calc(df, pvalue_index='P-value(Pearson)')[0]
-        df.rename(columns={'Adjusted-P': 'Adjusted-P(Pearson)'}, inplace=True)
-        df.drop(columns=['Significance'], inplace=True)
-        df.to_csv(self.output, sep='\t')
+def sort_results(filename, output, ix_list, chunksize=1000000):
+    """
+    Writes the raw results (see writer.ResultWriter) in the order of the pairs, with the pair indices as the index
+
+    The raw results are read in chunks of chunksize rows and split into temporary files (<output>.<k>) of chunksize
+    consecutive pair indices, which are sorted one at a time, so that no more than chunksize rows are read at once.
 
+    Returns the number of pairs.
+    """
+    buckets = {}
+    try:
+        for chunk in writer.read_results(filename, chunksize=chunksize):
+            chunk.index = feature_pair_index(chunk, ix_list)
+            for k, part in chunk.groupby(chunk.index // chunksize, sort=False):
+                mode = 'a' if k in buckets else 'w'
+                buckets[k] = '%s.%d' % (output, k)
+                part.to_csv(buckets[k], sep='\t', header=False, mode=mode)
+
+        n = 0
+        with open(output, 'w') as f:
+            f.write('\t'.join([''] + RESULT_COLUMNS) + '\n')
+            for k in sorted(buckets):
+                part = writer.read_results(buckets[k], header=None, names=['Pair'] + RESULT_COLUMNS, index_col=0)
+                part.index.name = None
+                part.sort_index(kind='stable').to_csv(f, sep='\t', header=False)
+                n += len(part)
+    finally:
+        for name in buckets.values():
+            if os.path.exists(name):
+                os.remove(name)
+    return n
+
+
+def merge_results(filenames, output, chunksize=1000000):
+    """
+    Merges the results of the shards (see Analyzer.evaluate_feature_association) and adjusts the p-values of all pairs
 
-def job_permutation(q_job, q_result):
+    The rows of a shard are a range of the pair indices, so the shards are written in the order of their pair indices
+    and the merged results are in the same order as those of a run without shards. Missing or duplicated pairs raise
+    a ValueError. The shards are read in chunks of chunksize rows.
+    """
+    ranges = []
+    for filename in filenames:
+        index = pd.read_csv(filename, sep='\t', usecols=[0]).iloc[:, 0].values
+        if len(index) and np.any(np.diff(index) != 1):
+            raise ValueError('The pairs of the shard are not contiguous: %s' % filename)
+        if len(index):
+            ranges.append((index[0], index[-1] + 1, filename))
+    ranges.sort()
+
+    n_pairs = 0
+    for start, end, filename in ranges:
+        if start < n_pairs:
+            raise ValueError('The shards have duplicated pairs')
+        if start > n_pairs:
+            raise ValueError('The shards are missing %d pairs' % (start - n_pairs))
+        n_pairs = end
+    n_features = int((1 + np.sqrt(1 + 8 * n_pairs)) / 2)
+    if n_features * (n_features - 1) // 2 != n_pairs:
+        raise ValueError('The shards are missing pairs of the last features')
+
+    fdr.FDR().adjust_files([f for _, _, f in ranges], output, ['P-value(FisherExact)', 'P-value(Pearson)'],
+                           ['Adjusted-P(FisherExact)', 'Adjusted-P(Pearson)'], chunksize=chunksize,
+                           index_col=0, float_precision='round_trip', dtype={'Feature1': str, 'Feature2': str})
+
+
+def result_table(res, ix_list):
+    """
+    Converts the numeric results of evaluate_pairs into a DataFrame with the feature names in ix_list.
+    """
+    df = pd.DataFrame(res[:, 2:], columns=RESULT_COLUMNS[2:])
+    df[['N12', 'N1', 'N2']] = df[['N12', 'N1', 'N2']].astype(np.int64)
+    df.insert(0, 'Feature2', ix_list[res[:, 1].astype(np.int64)])
+    df.insert(0, 'Feature1', ix_list[res[:, 0].astype(np.int64)])
+    return df
+
+
+def job_permutation(q_job, q_result, table_spec, engine='matrix', directionality='permutation', null_cache=None,
+                    seed=None, prescreen=None, feature_ids=None, sequential=None):
     """
     Executes permutation tests in multi-thread modes
+
+    Each job is a tile [i0, i1, j0, j1] of the pairs of the feature table shared through table_spec (see share_table),
+    and the tile is reported with the results of its pairs as a numeric array (see evaluate_pairs), the process ID of
+    the worker and the seconds spent on the tile.
+
+    engine: 'matrix' or 'pair' evaluation of the co-occurrence and quantitative association
+    directionality: 'permutation' or 'exact' test of the log ratios
+    null_cache: shared cache of the permutation null distributions (LRUCache proxy)
+    seed: random seed of the permutation tests
+    prescreen: p-value cutoff of the prescreen (see prescreen_mask)
+    feature_ids: IDs of the features seeding the permutations of the pairs (see pair_rng)
+    sequential: keyword arguments of the sequential permutation tests (see sequential_pvalue)
     """
+    shared, table = attach_table(table_spec)
+
     while True:
         j = q_job.get()
 
         if j['type'] == 'JOB':
-            ft1 = j['value'][0]
-            ft2 = j['value'][1]
-            v1 = j['value'][2]
-            v2 = j['value'][3]
-            cnt = j['value'][4]
-            if cnt % 100 == 0:
-                print(cnt)
-
-            oddsratio, pv_fs = cooccurrence.coocurrence(v1, v2)
+            i0, i1, j0, j1 = j['value']
+            start = time.perf_counter()
+            res = evaluate_pairs(table, i0, i1, j0, j1, engine, directionality, null_cache, seed, prescreen,
+                                 feature_ids, sequential)
+            q_result.put((j['value'], res, os.getpid(), time.perf_counter() - start))
+
+        try:
+            if j['type'] == 'CONTROL':
+                if j['value'] == 'END':
+                    break
+        except:
+            pass
+
+    for sa in shared:
+        sa.close()
+
+
+def share_table(table):
+    """
+    Places a feature matrix (np.ndarray or CSR matrix) in shared memory.
+
+    Returns the shared arrays (utility.SharedArray) and the picklable spec to attach to the matrix with attach_table().
+    """
+    if sparse.issparse(table):
+        table = sparse.csr_matrix(table)
+        shared = [utility.SharedArray.create(table.data),
+                  utility.SharedArray.create(table.indices),
+                  utility.SharedArray.create(table.indptr)]
+        return shared, ('csr', table.shape, [sa.spec for sa in shared])
+
+    shared = [utility.SharedArray.create(table)]
+    return shared, ('dense', table.shape, [shared[0].spec])
+
+
+def attach_table(table_spec):
+    """
+    Attaches to a feature matrix in shared memory. Returns the shared arrays and the matrix.
+    """
+    kind, shape, specs = table_spec
+    shared = [utility.SharedArray.attach(spec) for spec in specs]
+    if kind == 'csr':
+        table = sparse.csr_matrix((shared[0].array, shared[1].array, shared[2].array), shape=shape, copy=False)
+    else:
+        table = shared[0].array
+    return shared, table
+
+
+def pair_tiles(n_features, size, rows=None):
+    """
+    Generates the tiles [i0, i1, j0, j1] of size x size features covering the pairs (i, j) with i > j.
+
+    rows: the range of i (r0, r1) of the pairs (default: all features)
+    """
+    r0, r1 = rows if rows is not None else (0, n_features)
+    for i0 in range(r0, r1, size):
+        i1 = min(i0 + size, r1)
+        for j0 in range(0, i1 - 1, size):
+            yield [i0, i1, j0, min(j0 + size, n_features)]
+
+
+def tile_pairs(tile):
+    """
+    Returns the number of pairs (i, j) with j < i in the tile [i0, i1, j0, j1]
+    """
+    i0, i1, j0, j1 = tile
+    return sum(max(0, min(j1, i) - j0) for i in range(i0, i1))
+
+
+def shard_rows(n_features, k, n_shards):
+    """
+    Calculates the range of rows (r0, r1) of the k-th of n_shards slices of the pairs (i, j) with i > j
+
+    The row i has i pairs, so the rows are split into slices with about the same number of pairs.
+    """
+    n_pairs = np.arange(n_features + 1) * (np.arange(n_features + 1) - 1) // 2  # pairs of the rows < i
+    bounds = np.searchsorted(n_pairs, np.arange(n_shards + 1) * n_pairs[-1] / n_shards)
+    bounds[-1] = n_features
+    return int(bounds[k - 1]), int(bounds[k])
+
+
+def tile_size(max_memory, n_samples, n_worker=1):
+    """
+    Calculates the number of features per tile side so that the tiles of n_worker workers fit into max_memory (MB).
+    """
+    budget = max_memory * 2**20 / n_worker
+    a = BYTES_PER_PAIR
+    b = BYTES_PER_VALUE * n_samples
+    return max(1, int((-b + np.sqrt(b * b + 4 * a * budget)) / (2 * a)))
+
+
+def prescreen_mask(n12, pv_fs, cutoff):
+    """
+    Selects the pairs which cannot pass a significance cutoff of both association tests
+
+    The adjusted p-values are not smaller than the p-values, so a pair whose Fisher's exact test p-value is not below
+    the cutoff cannot pass the cutoff of the adjusted p-values. Pairs with less than quantitative.MIN_SAMPLES
+    co-present samples get Rho = 0 and a p-value of 1 in the correlation test.
+    """
+    return (np.asarray(pv_fs) >= cutoff) | (np.asarray(n12) < quantitative.MIN_SAMPLES)
+
+
+def evaluate_pairs(table, i0, i1, j0, j1, engine='matrix', directionality='permutation', null_cache=None, seed=None,
+                   prescreen=None, feature_ids=None, sequential=None):
+    """
+    Evaluates the interactions of the feature pairs (i, j) with i0 <= i < i1, j0 <= j < j1 and j < i.
+
+    With a prescreen cutoff, the directionality tests are skipped for the pairs selected by prescreen_mask(), which
+    get directionality p-values of 1. The correlations of all pairs are kept, so the adjusted p-values of the
+    correlations do not depend on the prescreen.
+
+    The permutations of a pair are drawn from a random generator seeded by the seed and the IDs of the features
+    in feature_ids (default: the row indices; see pair_rng), so the results do not depend on the tiles or the shards.
+
+    Returns a numeric array with a row per pair: the row indices i and j followed by the values of RESULT_COLUMNS[2:].
+    """
+    if feature_ids is None:
+        feature_ids = np.arange(table.shape[0])
+
+    if engine == 'matrix':
+        co = cooccurrence.coocurrence_matrix(table[i0:i1], table[j0:j1])
+        qt = quantitative.log_pearson_matrix(table[i0:i1], table[j0:j1])
+
+    n_pairs = tile_pairs((i0, i1, j0, j1))
+    res = np.zeros((n_pairs, len(RESULT_COLUMNS)))
+    k = 0
+    for i in range(i0, i1):
+        for j in range(j0, min(j1, i)):
+            if engine == 'matrix':
+                n_12, n_1, n_2 = int(co[0][i - i0, j - j0]), int(co[1][i - i0, j - j0]), int(co[2][i - i0, j - j0])
+                oddsratio, pv_fs = co[3][i - i0, j - j0], co[4][i - i0, j - j0]
+            else:
+                v1 = feature_table.row(table, i)
+                v2 = feature_table.row(table, j)
+                n_12 = int(np.count_nonzero((v1 != 0) & (v2 != 0)))
+                n_1 = int(np.count_nonzero(v1))
+                n_2 = int(np.count_nonzero(v2))
+
+                oddsratio, pv_fs = cooccurrence.coocurrence(v1, v2)
+
+            pruned = prescreen is not None and prescreen_mask(n_12, pv_fs, prescreen)
+            if engine == 'matrix':
+                rho, pv_ps = qt[0][i - i0, j - j0], qt[1][i - i0, j - j0]
+            else:
+                rho, pv_ps, _ = quantitative.log_pearson(v1, v2)
+
             if oddsratio == 1:
                 log_oddsratio = 0
             else:
                 log_oddsratio = np.log2(oddsratio)
 
-            nz1 = set(np.nonzero(v1)[0])
-            nz2 = set(np.nonzero(v2)[0])
-            ci = list(nz1.intersection(nz2))
+            if pruned:
+                lr_ori12, lr_ori21 = ct_info(count_table(n_12, n_1, n_2, table.shape[1]))
+                p12, p21 = 1.0, 1.0
+            else:
+                rng = None
+                if directionality == 'sequential' or (directionality == 'permutation' and null_cache is None):
+                    rng = pair_rng(seed, feature_ids[i], feature_ids[j])
+                lr_ori12, lr_ori21, p12, p21 = directionality_test(
+                    n_12, n_1, n_2, table.shape[1], directionality, null_cache, rng, seed, sequential)
 
-            v1_nz = np.log(v1[ci])
-            v2_nz = np.log(v2[ci])
+            res[k] = [i, j, n_12, n_1, n_2,
+                      log_oddsratio, rho, pv_fs, pv_ps,
+                      lr_ori12, lr_ori21, p12, p21]
+            k += 1
+    return res
 
-            if len(ci) <= 5:
-                rho = 0
-                pv_ps = 1.0
-            else:
-                sd1 = np.std(v1_nz)
-                sd2 = np.std(v2_nz)
 
-                if sd1 == 0 or sd2 == 0:
-                    rho = 0
-                    pv_ps = 1.
-                else:
-                    rho, pv_ps = pearsonr(v1_nz, v2_nz)
+def pair_rng(seed, feature1, feature2):
+    """
+    Creates the random generator of the permutations of a pair
 
-            # Directionality accessment
-            bv1 = np.array(v1, dtype=bool)
-            bv2 = np.array(v2, dtype=bool)
+    The counter-based Philox generator is keyed by the seed and the hash of the feature IDs, so the permutations of
+    a pair are the same in every tile, worker and shard (random if the seed is None).
+    """
+    if seed is None:
+        return np.random.Generator(np.random.Philox())
+    digest = hashlib.blake2b(('%s\t%s' % (feature1, feature2)).encode(), digest_size=8).digest()
+    return np.random.Generator(np.random.Philox(np.random.SeedSequence([seed, int.from_bytes(digest, 'little')])))
 
-            ct_ori = contingency_table(bv1, bv2)
-            lr_ori12, lr_ori21 = ct_info(ct_ori)
 
-            rv1 = np.copy(bv1)
-            rv2 = np.copy(bv2)
+def directionality_test(n12, n1, n2, n, directionality='permutation', null_cache=None, rng=None, seed=None,
+                        sequential=None):
+    """
+    Evaluates the directionality of a pair from the conditional occurrence
 
-            rs = []
-            for i in range(999):
-                np.random.shuffle(rv2)
+    The contingency table and its null distribution only depend on the number of co-occurring samples (n12),
+    the marginal counts (n1, n2) and the number of samples (n). The permutations are drawn from rng
+    (np.random.Generator), and the cached null distributions are seeded by seed.
+    The sequential tests take the keyword arguments in sequential (see sequential_pvalue).
 
-                ct = contingency_table(rv1, rv2)
-                lr12, lr21 = ct_info(ct)
-                rs.append([lr12, lr21])
-            rs = np.array(rs)
+    Returns:
+        lr12, lr21 (float): The log ratios of the observed contingency table.
+        p12, p21 (float): The p-values of the log ratios.
+    """
+    lr_ori12, lr_ori21 = ct_info(count_table(n12, n1, n2, n))
 
-            p12 = permut_pvalue(lr_ori12, rs[:, 0])
-            p21 = permut_pvalue(lr_ori21, rs[:, 1])
+    if directionality == 'exact':
+        p12, p21 = exact_pvalue(n12, n1, n2, n)
+    elif directionality == 'sequential':
+        p12, p21 = sequential_pvalue(n12, n1, n2, n, rng, **(sequential or {}))
+    else:
+        if null_cache is not None:
+            rs = permutation_null(n1, n2, n, null_cache, seed=seed)
+        else:
+            rs = permutation_null(n1, n2, n, rng=rng)
 
-            # Report results
-            q_result.put([ft1, ft2, len(ci), len(nz1), len(
-                nz2), log_oddsratio, rho, pv_fs, pv_ps,
-                lr_ori12, lr_ori21, p12, p21])
+        p12 = permut_pvalue(lr_ori12, rs[:, 0])
+        p21 = permut_pvalue(lr_ori21, rs[:, 1])
 
-        try:
-            if j['type'] == 'CONTROL':
-                if j['value'] == 'END':
-                    break
-        except:
-            pass
+    return lr_ori12, lr_ori21, p12, p21
 
 
 def contingency_table(a, b):
@@ -192,6 +690,14 @@ def contingency_table(a, b):
     return ct
 
 
+def count_table(n12, n1, n2, n):
+    """
+    Creates the contingency table of a pair from the number of co-occurring samples and the marginal counts
+    """
+    return np.array([[n12, n1 - n12],
+                     [n2 - n12, n - n1 - n2 + n12]], dtype=float)
+
+
 def ct_info(ct):
     """
     Claculates log odds ratio using the contingency table 
@@ -205,6 +711,42 @@ def ct_info(ct):
     return (ro12, ro21)
 
 
+def permutation_null(n1, n2, n, null_cache=None, n_permutations=999, seed=None, rng=None):
+    """
+    Generates the null distribution of the log ratios (LogRatio12, LogRatio21) by permutation tests.
+
+    The null distribution only depends on the marginal counts, so it is generated from presence/absence vectors
+    with n1 and n2 present samples, and shared through the cache for the pairs with the same (n1, n2, n).
+    The permutations are seeded by (seed, n1, n2, n), so the cached distribution does not depend on the pair generating it.
+    Without the cache, the permutations may be drawn from rng (np.random.Generator) instead.
+    """
+    key = (n1, n2, n)
+    if null_cache is not None:
+        rs = null_cache.get(key)
+        if rs is not None:
+            return rs
+
+    rv1 = np.zeros(n, dtype=bool)
+    rv1[:n1] = True
+    rv2 = np.zeros(n, dtype=bool)
+    rv2[:n2] = True
+
+    if rng is None:
+        rng = np.random.default_rng(None if seed is None else [seed, n1, n2, n])
+    rs = []
+    for i in range(n_permutations):
+        rng.shuffle(rv2)
+
+        ct = contingency_table(rv1, rv2)
+        lr12, lr21 = ct_info(ct)
+        rs.append([lr12, lr21])
+    rs = np.array(rs)
+
+    if null_cache is not None:
+        null_cache.put(key, rs)
+    return rs
+
+
 def permut_pvalue(val, vs):
     """
     Calculates the p-value for an input value (val) based on  the results of the permutation tests.
@@ -214,3 +756,77 @@ def permut_pvalue(val, vs):
     else:
         cnt = np.sum(vs < val)
     return (cnt + 1) / (len(vs) + 1)
+
+
+def sequential_pvalue(n12, n1, n2, n, rng=None, cutoff=0.05, n_permutations=999, max_permutations=9999,
+                      exceedances=10, batch_size=100, confidence=0.99):
+    """
+    Calculates the p-values of the log ratios (LogRatio12, LogRatio21) by sequential permutation tests.
+
+    A shuffle of the presence/absence vectors only changes the number of co-occurring samples, which follows the
+    hypergeometric distribution (see exact_pvalue), so the permutations are drawn as co-occurrence counts in batches.
+    The test of a log ratio stops
+    - with the estimate g / L of Besag and Clifford (1991), when the permuted log ratios exceeded the observed one
+      g >= exceedances times in L permutations and the p-value is above the cutoff with the confidence;
+    - with (g + 1) / (L + 1) as permut_pvalue(), after n_permutations when the p-value is below the cutoff with the
+      confidence, or after max_permutations otherwise.
+    Clearly non-significant pairs stop after a few permutations, and the pairs close to the cutoff get up to
+    max_permutations permutations.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    lr_ori = ct_info(count_table(n12, n1, n2, n))
+    alpha = (1 - confidence) / 2
+
+    g = np.zeros(2, dtype=np.int64)
+    ps = [None, None]
+    L = 0
+    while L < max_permutations and None in ps:
+        b = min(batch_size, max_permutations - L)
+        if L < n_permutations:
+            b = min(b, n_permutations - L)
+        k = rng.hypergeometric(n1, n - n1, n2, size=b)
+        lrs = ct_info(np.array([[k, n1 - k],
+                                [n2 - k, n - n1 - n2 + k]], dtype=float))
+        for d in range(2):
+            if ps[d] is None:
+                g[d] += np.sum(lrs[d] > lr_ori[d]) if lr_ori[d] > 0 else np.sum(lrs[d] < lr_ori[d])
+        L += b
+
+        for d in range(2):
+            if ps[d] is not None:
+                continue
+            if g[d] >= exceedances and beta.ppf(alpha, g[d], L - g[d] + 1) > cutoff:
+                ps[d] = g[d] / L
+            elif L >= n_permutations and beta.ppf(1 - alpha, g[d] + 1, L - g[d]) < cutoff:
+                ps[d] = (g[d] + 1) / (L + 1)
+
+    return tuple(float(p) if p is not None else (g[d] + 1) / (L + 1) for d, p in enumerate(ps))
+
+
+def exact_pvalue(n12, n1, n2, n):
+    """
+    Calculates the exact p-values of the log ratios (LogRatio12, LogRatio21) without permutations.
+
+    Shuffling a presence/absence vector keeps both marginals (n1, n2) fixed, so the number of co-occurring
+    samples follows the hypergeometric distribution with n samples, n1 successes and n2 draws.
+    The log ratios of every possible contingency table are evaluated with ct_info(), and the p-value is the probability
+    of tables more extreme than the observed one. As in permut_pvalue() and sequential_pvalue(), the tables tied with
+    the observed one are not counted, so the p-value is the limit of the permutation p-values for many permutations.
+    """
+    # Contingency tables of the support of the hypergeometric distribution
+    k = np.arange(max(0, n1 + n2 - n), min(n1, n2) + 1)
+    ct = np.array([[k, n1 - k],
+                   [n2 - k, n - n1 - n2 + k]], dtype=float)
+    lr12, lr21 = ct_info(ct)
+    pmf = hypergeom.pmf(k, n, n1, n2)
+
+    i = n12 - k[0]
+    ps = []
+    for lr in (lr12, lr21):
+        if lr[i] > 0:
+            p = np.sum(pmf[lr > lr[i]])
+        else:
+            p = np.sum(pmf[lr < lr[i]])
+        ps.append(min(p, 1.0))
+    return ps[0], ps[1]
@@ -4,11 +4,30 @@ The main module of the Microbial Interaction Network (MINet) package.
 Sub-commands:
 
 - interaction: Calculates pairwise statistical interactions.
+- merge: Merges the interaction results of the shards of an analysis.
 - network: Creates a network from the statistical analysis results. 
+- run: Runs the interaction analysis and creates the network in one process.
+
+The arguments are parsed before the modules of the sub-commands are imported, so that the numeric stack is only
+loaded by the sub-commands that need it (see arguments).
 """
+import os
 import argparse
-from minet import interaction_analysis
-from minet import network
+import logging
+from minet import arguments
+
+logger = logging.getLogger('minet')
+
+
+def cache_dir(args):
+    """
+    Returns the directory of the binary table cache of the arguments (None without the cache)
+    """
+    from minet import feature_table
+
+    if args.no_cache:
+        return None
+    return args.cache_dir if args.cache_dir is not None else feature_table.CACHE_DIR
 
 
 def main():
@@ -23,25 +42,91 @@ def main():
         dest='command', title='sub-commands', help='sub-command help')
 
     # sub-parser
-    subparsers.add_parser('interaction', parents=[interaction_analysis.parser],
+    subparsers.add_parser('interaction', parents=[arguments.interaction_parser, arguments.metrics_parser],
                           help='Interaction analysis')
-    subparsers.add_parser('network', parents=[network.parser],
+    subparsers.add_parser('merge', parents=[arguments.merge_parser, arguments.metrics_parser],
+                          help='Merge the interaction analysis results of shards')
+    subparsers.add_parser('network', parents=[arguments.network_parser, arguments.metrics_parser],
                           help='Network analysis')
+    subparsers.add_parser('run', parents=[arguments.pipeline_parser, arguments.metrics_parser],
+                          help='Interaction and network analysis in one process')
 
     # parse arguments
     args = parser.parse_args()
     cmd = args.command
+    if cmd is None:
+        parser.print_help()
+        return
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    from minet import metrics
+    mt = metrics.Metrics()
 
     # Load feature table
     if cmd == 'interaction':
-        analyzer = interaction_analysis.Analyzer()
-        if args.no_preprocess:
-            analyzer.load_feature_table(args.input, depth=args.depth, prevalence=args.prevalence, preprocessing=False)
+        from minet import interaction_analysis
+
+        analyzer = interaction_analysis.Analyzer(metrics=mt)
+        if args.resume and analyzer.load_checkpoint(args.output, args.input, args.depth, args.prevalence,
+                                                     not args.no_preprocess):
+            pass
+        elif args.no_preprocess:
+            analyzer.load_feature_table(args.input, depth=args.depth, prevalence=args.prevalence, preprocessing=False,
+                                        seed=args.seed, sparse_table=args.sparse,
+                                        cache_dir=cache_dir(args),
+                                        cache_size=args.cache_size)
         else:
-            analyzer.load_feature_table(args.input, depth=args.depth, prevalence=args.prevalence, preprocessing=True)            
-        analyzer.evaluate_feature_association(args.output)
+            analyzer.load_feature_table(args.input, depth=args.depth, prevalence=args.prevalence, preprocessing=True,
+                                        seed=args.seed, sparse_table=args.sparse,
+                                        cache_dir=cache_dir(args),
+                                        cache_size=args.cache_size)
+        analyzer.evaluate_feature_association(
+            args.output, engine=args.engine, directionality=args.directionality,
+            null_cache_size=args.null_cache_size, max_memory=args.max_memory,
+            seed=args.seed, resume=args.resume, checkpoint_interval=args.checkpoint_interval,
+            prescreen=args.prescreen, shard=args.shard,
+            sequential={'cutoff': args.pval_dir, 'max_permutations': args.max_permutations,
+                        'exceedances': args.exceedances})
+    elif cmd == 'merge':
+        from minet import interaction_analysis
+
+        with mt.stage('merge', shards=len(args.input)):
+            interaction_analysis.merge_results(args.input, args.output)
     elif cmd == 'network':
-        nt = network.Network()
-        nt.load_interaction_results(
-            args.input, args.fdr_co, args.fdr_qt, args.co_type, args.qt_type, args.pval_dir)
-        nt.write_graph(args.output)
+        from minet import network
+
+        sweep = bool(args.sweep_fdr_co or args.sweep_fdr_qt or args.sweep_pval_dir)
+        if args.output is None:
+            args.output = 'network_sweep.tsv' if sweep else 'network.xml'
+
+        if sweep:
+            with mt.stage('sweep') as record:
+                stats = network.sweep_thresholds(
+                    args.input, args.sweep_fdr_co or [args.fdr_co], args.sweep_fdr_qt or [args.fdr_qt],
+                    args.sweep_pval_dir or [args.pval_dir], args.co_type, args.qt_type,
+                    network_prefix=os.path.splitext(args.output)[0] if args.sweep_networks else None,
+                    format=args.format)
+                record['networks'] = len(stats)
+            logger.info('Threshold sweep:\n%s', stats.to_string(index=False))
+            stats.to_csv(args.output, sep='\t', index=False)
+        else:
+            nt = network.Network(metrics=mt)
+            nt.load_interaction_results(
+                args.input, args.fdr_co, args.fdr_qt, args.co_type, args.qt_type, args.pval_dir)
+            nt.write_graph(args.output, format=args.format)
+    elif cmd == 'run':
+        from minet import pipeline
+
+        pipeline.run(
+            args.input, args.output, results_output=args.results, depth=args.depth, prevalence=args.prevalence,
+            preprocessing=not args.no_preprocess, seed=args.seed, sparse_table=args.sparse,
+            cache_dir=cache_dir(args), cache_size=args.cache_size,
+            fdr_co=args.fdr_co, fdr_qt=args.fdr_qt, co_type=args.co_type, qt_type=args.qt_type,
+            pval_dir=args.pval_dir, format=args.format, resume=args.resume, metrics=mt,
+            engine=args.engine, directionality=args.directionality, null_cache_size=args.null_cache_size,
+            max_memory=args.max_memory, checkpoint_interval=args.checkpoint_interval, prescreen=args.prescreen,
+            sequential={'max_permutations': args.max_permutations, 'exceedances': args.exceedances})
+
+    logger.info('Peak RSS: %.1f MB', mt.sample_rss(force=True) / 2**20)
+    if args.metrics:
+        mt.write(args.metrics)
@@ -0,0 +1,108 @@
+"""
+Metrics module
+
+This module measures the stages of the analyses and reports them through the minet loggers and an optional JSON file.
+
+- wall time of each stage, and the throughput of the stages processing pairs
+- utilization of the workers and depths of the job queues (see utility.Manager)
+- peak resident set size (RSS) of the process and its workers
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from minet import arguments
+
+logger = logging.getLogger(__name__)
+
+# Arguments (see arguments)
+parser = arguments.metrics_parser
+
+
+def rss():
+    """
+    Returns the resident set size (bytes) of the process and its child processes
+    """
+    process = psutil.Process()
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+class Metrics:
+    """
+    Collects the metrics of the stages of an analysis.
+    """
+
+    def __init__(self, sample_interval=1.0):
+        """
+        Initializes the metrics
+
+        sample_interval: the minimum seconds between the RSS samples of sample_rss()
+        """
+        self.stages = {}
+        self.peak_rss = 0
+        self.sample_interval = sample_interval
+        self.t_sample = 0.
+        self.t_start = time.time()
+
+    def sample_rss(self, force=False):
+        """
+        Updates the peak RSS, at most once per sample_interval unless forced
+        """
+        now = time.time()
+        if force or now - self.t_sample >= self.sample_interval:
+            self.t_sample = now
+            self.peak_rss = max(self.peak_rss, rss())
+        return self.peak_rss
+
+    @contextmanager
+    def stage(self, name, **values):
+        """
+        Measures the wall time of a stage
+
+        The values, and those added to the yielded dict in the stage, are kept with the metrics of the stage.
+        A stage with the number of pairs ('pairs') reports its throughput ('pairs_per_second').
+        """
+        record = dict(values)
+        start = time.perf_counter()
+        self.sample_rss(force=True)
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if record.get('pairs') and record['seconds'] > 0:
+                record['pairs_per_second'] = record['pairs'] / record['seconds']
+            record['peak_rss_mb'] = self.sample_rss(force=True) / 2**20
+            self.stages[name] = record
+            logger.info('Stage %s: %s', name, ', '.join('%s=%s' % (k, _format(v)) for k, v in record.items()))
+
+    def summary(self):
+        """
+        Returns the metrics as a dict
+        """
+        return {'stages': self.stages, 'seconds': time.time() - self.t_start,
+                'peak_rss_mb': self.sample_rss(force=True) / 2**20}
+
+    def write(self, filename):
+        """
+        Writes the metrics into a JSON file
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.4g' % value
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (k, _format(v)) for k, v in value.items())
+    return value
@@ -4,34 +4,32 @@ Network File Handling Module
 This module parses the association analysis results and creates a microbial interaction network.
 """
 
-import argparse
 import logging
+from xml.sax.saxutils import escape
 
+import numpy as np
 import pandas as pd
-
+from minet import arguments
 from minet.cytoscape import CytoscapeXGMML
+from minet.metrics import Metrics
 
 # Create a logger
 logger = logging.getLogger(__name__)
 
-# Arguments
-parser = argparse.ArgumentParser(add_help=False)
-parser.add_argument('-i', dest='input', type=str,
-                    help='Input result file')
-parser.add_argument('-o', dest='output', type=str, default='network.xml',
-                    help='Output network file (default: %(default)s)')
-parser.add_argument('--fdr-cooccurrence', dest='fdr_co', default=0.05, type=float,
-                    help='FDR of coocurrence analysis (default: %(default)s)')
-parser.add_argument('--cooccurrence-type', dest='co_type', default='positive', type=str,
-                    help='Association type (default: %(default)s)')
+# Network file formats and their extensions
+FORMATS = {'xgmml': ['.xml', '.xgmml'],
+           'graphml': ['.graphml'],
+           'csr': ['.csr.npz'],
+           'npz': ['.npz'],
+           'parquet': ['.parquet'],
+           'feather': ['.feather']}
 
-parser.add_argument('--fdr-quantitative', dest='fdr_qt', default=0.05, type=float,
-                    help='FDR of quantitative analysis (Pearson\'s correlation) (default: %(default)s)')
-parser.add_argument('--quantitative-type', dest='qt_type', default='positive', type=str,
-                    help='Association type (default: %(default)s)')
+# Columns of the interaction analysis results used by the network
+NETWORK_COLUMNS = ['Feature1', 'Feature2', 'LogOddsRatio', 'Rho',
+                   'P-value(12)', 'P-value(21)', 'Adjusted-P(FisherExact)', 'Adjusted-P(Pearson)']
 
-parser.add_argument('--directionality-p-value', dest='pval_dir', default=0.05, type=float,
-                    help='Association type (default: %(default)s)')
+# Arguments (see arguments)
+parser = arguments.network_parser
 
 
 class Network:
@@ -39,63 +37,329 @@ class Network:
     Network analysis class
     """
 
-    def __init__(self) -> None:
+    def __init__(self, metrics=None) -> None:
         """
         Initializes the network analysis object.
+
+        The network is stored in arrays: the names of the nodes, and the nodes (integer IDs, the positions in
+        node_names) and the properties of the directed edges.
+
+        metrics: the metrics.Metrics collecting the measurements of the stages (a new one if None)
+        """
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.node_names = np.zeros(0, dtype=object)
+        self.edge_source = np.zeros(0, dtype=np.int64)
+        self.edge_target = np.zeros(0, dtype=np.int64)
+        self.edge_rho = np.zeros(0)
+        self.edge_log_odds_ratio = np.zeros(0)
+
+    @property
+    def nodes(self):
         """
-        self.nodes = {}
-        self.edges = {}
+        The nodes as a dictionary of the node names and the node properties
+        """
+        return {n: {'name': n} for n in self.node_names.tolist()}
+
+    @property
+    def edges(self):
+        """
+        The edges as a dictionary of the pairs of node names and the edge properties
+        """
+        names = self.node_names
+        return {(s, t): {'Rho': r, 'LogOddsRatio': lo}
+                for s, t, r, lo in zip(names[self.edge_source].tolist(), names[self.edge_target].tolist(),
+                                       self.edge_rho.tolist(), self.edge_log_odds_ratio.tolist())}
 
     def load_interaction_results(self, filename, fdr_co=0.05, fdr_qt=0.05, co_type='positive', qt_type='positive', pval_dir=0.05):
         """
         Loads interaction results and filters interactions
+
+        Only the columns of the filters and the edge properties are read. A pair passing the filters adds its features
+        to the nodes, and its directed edges with the p-values (P-value(12), P-value(21)) below pval_dir to the edges.
+        The nodes and the edges are kept in the order of the pairs, and the properties of an edge added twice are
+        those of the last pair.
         """
-        association = pd.read_csv(filename, sep='\t')
-        idx = association.index[(association['Adjusted-P(Pearson)'] < fdr_qt)
-                                & (association['Adjusted-P(FisherExact)'] < fdr_co)]
-        association = association.loc[idx, :]
-
-        if co_type == 'positive':
-            idx = association.index[association['LogOddsRatio'] > 0]
-            association = association.loc[idx, :]
-        elif co_type == 'negative':
-            idx = association.index[association['LogOddsRatio'] < 0]
-            association = association.loc[idx, :]
-
-        if qt_type == 'positive':
-            idx = association.index[association['Rho'] > 0]
-            association = association.loc[idx, :]
-        elif qt_type == 'negative':
-            idx = association.index[association['Rho'] < 0]
-            association = association.loc[idx, :]
-
-        for id, row in association.iterrows():
-            ft1 = row['Feature1']
-            ft2 = row['Feature2']
-
-            self.nodes[ft1] = {'name': ft1}
-            self.nodes[ft2] = {'name': ft2}
-
-            if row['P-value(12)'] < pval_dir:
-                e = [ft1, ft2]
-                self.edges[tuple(e)] = {'Rho': row['Rho'],
-                                        'LogOddsRatio': row['LogOddsRatio']}
-            if row['P-value(21)'] < pval_dir:
-                e = [ft2, ft1]
-                self.edges[tuple(e)] = {'Rho': row['Rho'],
-                                        'LogOddsRatio': row['LogOddsRatio']}
-
-    def write_graph(self, filename):
+        with self.metrics.stage('read_results'):
+            association = pd.read_csv(filename, sep='\t', usecols=NETWORK_COLUMNS)
+        self.load_associations(association, fdr_co, fdr_qt, co_type, qt_type, pval_dir)
+
+    def load_associations(self, association, fdr_co=0.05, fdr_qt=0.05, co_type='positive', qt_type='positive',
+                          pval_dir=0.05):
+        """
+        Filters the interaction results in a DataFrame (e.g. of Analyzer.evaluate_feature_association) and adds the
+        interactions (see load_interaction_results)
+        """
+        with self.metrics.stage('load_network', pairs=len(association)) as record:
+            association = select_associations(association, co_type, qt_type)
+            mask = ((association['Adjusted-P(Pearson)'].values < fdr_qt)
+                    & (association['Adjusted-P(FisherExact)'].values < fdr_co))
+            self.add_associations(association[mask], pval_dir)
+            record.update(nodes=len(self.node_names), edges=len(self.edge_source))
+
+    def add_associations(self, association, pval_dir=0.05):
+        """
+        Adds the nodes and the directed edges of the pairs (see load_interaction_results)
+        """
+        # Nodes in the order of the pairs (Feature1, Feature2)
+        features = np.column_stack([association['Feature1'].values.astype(object),
+                                    association['Feature2'].values.astype(object)])
+        codes, names = pd.factorize(np.concatenate([self.node_names, features.ravel()]))
+        n_previous = len(self.node_names)
+        pairs = codes[n_previous:].reshape(-1, 2)
+
+        # Directed edges of the pairs: (Feature1, Feature2) for P-value(12) and (Feature2, Feature1) for P-value(21)
+        directed = np.column_stack([association['P-value(12)'].values < pval_dir,
+                                    association['P-value(21)'].values < pval_dir]).ravel()
+        source = pairs.ravel()[directed]
+        target = pairs[:, ::-1].ravel()[directed]
+        rho = np.repeat(association['Rho'].values, 2)[directed]
+        log_odds_ratio = np.repeat(association['LogOddsRatio'].values, 2)[directed]
+
+        self.node_names = np.asarray(names, dtype=object)
+        self.edge_source = np.concatenate([self.edge_source, source])
+        self.edge_target = np.concatenate([self.edge_target, target])
+        self.edge_rho = np.concatenate([self.edge_rho, rho])
+        self.edge_log_odds_ratio = np.concatenate([self.edge_log_odds_ratio, log_odds_ratio])
+        self._merge_edges()
+
+    def _merge_edges(self):
+        """
+        Merges the edges between the same nodes at the position of the first edge with the properties of the last edge
+        """
+        key = self.edge_source * len(self.node_names) + self.edge_target
+        unique, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        if len(unique) == len(key):
+            return
+
+        last = np.zeros(len(unique), dtype=np.int64)
+        np.maximum.at(last, inverse, np.arange(len(key)))
+        order = np.argsort(first)
+        first, last = first[order], last[order]
+
+        self.edge_source = self.edge_source[first]
+        self.edge_target = self.edge_target[first]
+        self.edge_rho = self.edge_rho[last]
+        self.edge_log_odds_ratio = self.edge_log_odds_ratio[last]
+
+    def write_graph(self, filename, format=None):
         """
         Writes the interactions into a network file.
+
+        format: 'xgmml', 'graphml', 'npz' (edge list), 'csr' (sparse adjacency matrix), 'parquet' or 'feather'
+        (edge list); by the extension of the file if None (see FORMATS), or 'xgmml' for unknown extensions.
+        """
+        if format is None:
+            format = graph_format(filename)
+
+        with self.metrics.stage('write_network', format=format, nodes=len(self.node_names),
+                                edges=len(self.edge_source)):
+            self._write_graph(filename, format)
+
+    def _write_graph(self, filename, format):
         """
-        cx = CytoscapeXGMML()
-        for n in self.nodes:
-            cx.add_node(n, self.nodes[n])
+        Writes the interactions into a network file of the format (see write_graph)
+        """
+        logger.info('Number of nodes: %d', len(self.node_names))
+        logger.info('Number of edges: %d', len(self.edge_source))
+
+        if format == 'xgmml':
+            names = self.node_names
+            cx = CytoscapeXGMML()
+            cx.add_nodes((n, {'name': n}) for n in names.tolist())
+            cx.add_edges((s, t, {'Rho': r, 'LogOddsRatio': lo})
+                         for s, t, r, lo in zip(names[self.edge_source].tolist(), names[self.edge_target].tolist(),
+                                                self.edge_rho.tolist(), self.edge_log_odds_ratio.tolist()))
+
+            cx.write_graph(filename)
+            return
+
+        names, source, target, rho, log_odds_ratio = self.edge_arrays()
+        if format == 'graphml':
+            write_graphml(filename, names, source, target, rho, log_odds_ratio)
+        elif format == 'npz':
+            # Written through the file so that the '.npz' extension is not appended to the file name
+            with open(filename, 'wb') as f:
+                np.savez_compressed(f, nodes=names, source=source, target=target,
+                                    Rho=rho, LogOddsRatio=log_odds_ratio)
+        elif format == 'csr':
+            write_csr(filename, names, source, target, rho, log_odds_ratio)
+        elif format in ('parquet', 'feather'):
+            write_edge_table(filename, format, names, source, target, rho, log_odds_ratio)
+        else:
+            raise ValueError('Unknown network file format: %s' % format)
+
+    def edge_arrays(self):
+        """
+        Returns the network as arrays
+
+        Returns:
+            names (np.ndarray): The names of the nodes; the integer ID of a node is its position.
+            source, target (np.ndarray): The integer IDs of the nodes of the directed edges.
+            rho, log_odds_ratio (np.ndarray): The properties of the edges.
+        """
+        names = np.array([str(n) for n in self.node_names.tolist()])
+        return names, self.edge_source, self.edge_target, self.edge_rho, self.edge_log_odds_ratio
+
 
-        for e in self.edges:
-            cx.add_edge(e[0], e[1], self.edges[e])
+def read_associations(filename, co_type='positive', qt_type='positive'):
+    """
+    Reads the columns of the interaction results used by the network, and keeps the pairs of the association types
+    """
+    return select_associations(pd.read_csv(filename, sep='\t', usecols=NETWORK_COLUMNS), co_type, qt_type)
+
+
+def select_associations(association, co_type='positive', qt_type='positive'):
+    """
+    Keeps the pairs of the association types ('positive', 'negative' or any other value for both) of the results
+    """
+    mask = np.ones(len(association), dtype=bool)
+    if co_type == 'positive':
+        mask &= association['LogOddsRatio'].values > 0
+    elif co_type == 'negative':
+        mask &= association['LogOddsRatio'].values < 0
+
+    if qt_type == 'positive':
+        mask &= association['Rho'].values > 0
+    elif qt_type == 'negative':
+        mask &= association['Rho'].values < 0
+    return association[mask].reset_index(drop=True)
+
+
+def sweep_thresholds(filename, fdr_co=(0.05,), fdr_qt=(0.05,), pval_dir=(0.05,), co_type='positive',
+                     qt_type='positive', network_prefix=None, format=None):
+    """
+    Calculates the numbers of pairs, nodes and edges of the networks over a grid of cutoffs
+
+    The results are read once, and the pairs are sorted by Adjusted-P(FisherExact). Each pair is ranked by the first
+    cutoffs of Adjusted-P(Pearson) and P-value(12)/P-value(21) it passes, so the cutoffs are compared once. For each
+    cutoff of Adjusted-P(Pearson), the cooccurrence cutoffs are visited in increasing order, and only the pairs between
+    two cutoffs (a slice of the sorted pairs) update the degrees of the nodes and the cumulative counts of the edges
+    of all the directionality cutoffs.
+
+    With network_prefix, the network of every point is also written to
+    <network_prefix>.<fdr_co>_<fdr_qt>_<pval_dir><extension> in the format (default: xgmml).
+
+    Returns:
+        pd.DataFrame: The cutoffs and the numbers of pairs, nodes and edges, and the density of each network.
+    """
+    association = read_associations(filename, co_type, qt_type)
+    order = np.argsort(association['Adjusted-P(FisherExact)'].values, kind='stable')
+    association = association.iloc[order].reset_index(drop=True)
+
+    p_co = association['Adjusted-P(FisherExact)'].values
+    p_qt = association['Adjusted-P(Pearson)'].values
+    codes, names = pd.factorize(np.concatenate([association['Feature1'].values.astype(object),
+                                                association['Feature2'].values.astype(object)]))
+    f1, f2 = codes[:len(association)], codes[len(association):]
+
+    fdr_co, fdr_qt, pval_dir = sorted(fdr_co), sorted(fdr_qt), sorted(pval_dir)
+    bounds = np.searchsorted(p_co, fdr_co, side='left')  # pairs with p_co < cutoff
+    # Index of the first cutoff passed by each pair (p < cutoff)
+    rank_qt = np.searchsorted(fdr_qt, p_qt, side='right')
+    rank12 = np.searchsorted(pval_dir, association['P-value(12)'].values, side='right')
+    rank21 = np.searchsorted(pval_dir, association['P-value(21)'].values, side='right')
+
+    rows = []
+    for k, qt in enumerate(fdr_qt):
+        degree = np.zeros(len(names), dtype=np.int64)
+        n_pairs = n_nodes = 0
+        n_edges = np.zeros(len(pval_dir), dtype=np.int64)
+        counts = []
+        start = 0
+        for end in bounds:
+            sl = np.nonzero(rank_qt[start:end] <= k)[0] + start
+            nodes = np.concatenate([f1[sl], f2[sl]])
+            new_nodes = np.unique(nodes[degree[nodes] == 0])
+            np.add.at(degree, nodes, 1)
+            n_nodes += len(new_nodes)
+            n_pairs += len(sl)
+            # Edges by the first directionality cutoff they pass
+            first = np.bincount(rank12[sl], minlength=len(pval_dir) + 1)
+            first += np.bincount(rank21[sl], minlength=len(pval_dir) + 1)
+            n_edges += np.cumsum(first)[:len(pval_dir)]
+            counts.append((n_pairs, n_nodes, n_edges.copy()))
+            start = end
+
+        for d, pd_cut in enumerate(pval_dir):
+            for co, (n_pairs, n_nodes, edges) in zip(fdr_co, counts):
+                n_edges = int(edges[d])
+                rows.append([co, qt, pd_cut, n_pairs, n_nodes, n_edges,
+                             n_edges / (n_nodes * (n_nodes - 1)) if n_nodes > 1 else 0.])
+
+                if network_prefix is not None:
+                    # Pairs of the network in the order of the results
+                    selected = np.nonzero((p_co < co) & (p_qt < qt))[0]
+                    selected = selected[np.argsort(order[selected])]
+                    nt = Network()
+                    nt.add_associations(association.iloc[selected], pd_cut)
+                    nt.write_graph('%s.%g_%g_%g%s' % (network_prefix, co, qt, pd_cut, FORMATS[format or 'xgmml'][0]),
+                                   format=format)
 
-        print('Number of nodes:', len(cx.Graph.Nodes))
-        print('Number of edges:', len(cx.Graph.Edges))
-        cx.write_graph(filename)
+    return pd.DataFrame(rows, columns=['FDR(Cooccurrence)', 'FDR(Quantitative)', 'P-value(Directionality)',
+                                       'Pairs', 'Nodes', 'Edges', 'Density'])
+
+
+def graph_format(filename):
+    """
+    Determines the network file format by the extension of the file name
+    """
+    # '.csr.npz' is checked before '.npz'
+    for format, extensions in FORMATS.items():
+        if any(filename.lower().endswith(ext) for ext in extensions):
+            return format
+    return 'xgmml'
+
+
+def write_graphml(filename, names, source, target, rho, log_odds_ratio):
+    """
+    Writes a directed network in GraphML format with the node names and the edge properties
+    """
+    with open(filename, 'w', buffering=2**20) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        f.write('<key id="name" for="node" attr.name="name" attr.type="string"/>\n')
+        f.write('<key id="Rho" for="edge" attr.name="Rho" attr.type="double"/>\n')
+        f.write('<key id="LogOddsRatio" for="edge" attr.name="LogOddsRatio" attr.type="double"/>\n')
+        f.write('<graph id="network" edgedefault="directed">\n')
+        for i, name in enumerate(names):
+            f.write('<node id="n%d"><data key="name">%s</data></node>\n' % (i, escape(name)))
+        for i, j, r, lo in zip(source, target, rho, log_odds_ratio):
+            f.write('<edge source="n%d" target="n%d"><data key="Rho">%r</data><data key="LogOddsRatio">%r</data></edge>\n'
+                    % (i, j, float(r), float(lo)))
+        f.write('</graph>\n')
+        f.write('</graphml>\n')
+
+
+def write_csr(filename, names, source, target, rho, log_odds_ratio):
+    """
+    Writes the adjacency matrix of a directed network as a CSR matrix weighted by Rho
+
+    The file is read by scipy.sparse.load_npz. It also holds the node names (nodes) and the LogOddsRatio of the
+    non-zero entries (LogOddsRatio, in the order of the data of the matrix), which are read with np.load.
+    """
+    n = len(names)
+    order = np.lexsort((target, source))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=n), out=indptr[1:])
+    with open(filename, 'wb') as f:
+        np.savez_compressed(f, format=np.array('csr'), shape=np.array([n, n]),
+                            data=rho[order], indices=target[order], indptr=indptr,
+                            LogOddsRatio=log_odds_ratio[order], nodes=names)
+
+
+def write_edge_table(filename, format, names, source, target, rho, log_odds_ratio):
+    """
+    Writes the edge list of a network as a Parquet or Feather table (requires pyarrow)
+
+    The edges have the integer IDs of the nodes (Source, Target), and the names of the nodes are written to
+    a node table (<filename>.nodes.<format>) with the integer IDs (ID, Name).
+    """
+    edges = pd.DataFrame({'Source': source, 'Target': target, 'Rho': rho, 'LogOddsRatio': log_odds_ratio})
+    nodes = pd.DataFrame({'ID': np.arange(len(names)), 'Name': names})
+    node_filename = '%s.nodes.%s' % (filename.rsplit('.', 1)[0], format)
+    if format == 'parquet':
+        edges.to_parquet(filename, index=False)
+        nodes.to_parquet(node_filename, index=False)
+    else:
+        edges.to_feather(filename)
+        nodes.to_feather(node_filename)
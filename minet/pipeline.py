@@ -0,0 +1,66 @@
+"""
+Pipeline module
+
+This module runs the whole analysis in one process: feature table -> Preprocessor -> Analyzer -> Network -> network
+file. Without a results file, the interaction results are passed to the network as a DataFrame; with a results file,
+they are written and adjusted out of core, and the network reads only its columns from the file.
+"""
+
+from minet import arguments
+from minet.interaction_analysis import Analyzer
+from minet.network import Network
+from minet.metrics import Metrics
+
+# Arguments (see arguments)
+parser = arguments.pipeline_parser
+
+
+def run(table, network_output=None, results_output=None, depth=10000, prevalence=0.1, preprocessing=True, seed=None,
+        sparse_table=False, cache_dir=None, cache_size=None, fdr_co=0.05, fdr_qt=0.05, co_type='positive',
+        qt_type='positive', pval_dir=0.05, format=None, resume=False, metrics=None, **analysis):
+    """
+    Analyzes the interactions of a feature table and creates the network
+
+    Parameters:
+    table (str or pd.DataFrame): Feature table file, or feature table (features x samples).
+    network_output (str, optional): Network file (see Network.write_graph); not written if None.
+    results_output (str, optional): Interaction analysis result file; the results are kept in memory if None.
+    depth, prevalence, preprocessing, seed, sparse_table, cache_dir, cache_size: See Analyzer.load_feature_table.
+    fdr_co, fdr_qt, co_type, qt_type, pval_dir: See Network.load_interaction_results. pval_dir is also the cutoff
+        of the sequential directionality test.
+    format (str, optional): Network file format (see Network.write_graph).
+    resume (bool): Resumes the analysis from the checkpoint of results_output.
+    metrics (metrics.Metrics, optional): Collects the measurements of the stages.
+    analysis: Keyword arguments of Analyzer.evaluate_feature_association (engine, directionality, max_memory, ...).
+
+    Returns:
+        results (pd.DataFrame): Interaction analysis results (None with a results file).
+        network (Network): Network of the interactions.
+    """
+    if analysis.get('shard') is not None:
+        raise ValueError('The network needs the results of all the pairs; merge the shards with merge_results')
+
+    metrics = metrics if metrics is not None else Metrics()
+    analyzer = Analyzer(metrics=metrics)
+    if resume and results_output is not None and analyzer.load_checkpoint(
+            results_output, table if isinstance(table, str) else None, depth, prevalence, preprocessing):
+        pass
+    elif isinstance(table, str):
+        analyzer.load_feature_table(table, depth=depth, prevalence=prevalence, preprocessing=preprocessing, seed=seed,
+                                    sparse_table=sparse_table, cache_dir=cache_dir, cache_size=cache_size)
+    else:
+        analyzer.set_feature_table(table, depth=depth, prevalence=prevalence, preprocessing=preprocessing, seed=seed)
+
+    sequential = dict(analysis.pop('sequential', None) or {})
+    sequential.setdefault('cutoff', pval_dir)
+    results = analyzer.evaluate_feature_association(results_output, seed=seed, resume=resume,
+                                                    sequential=sequential, **analysis)
+
+    network = Network(metrics=metrics)
+    if results is None:
+        network.load_interaction_results(results_output, fdr_co, fdr_qt, co_type, qt_type, pval_dir)
+    else:
+        network.load_associations(results, fdr_co, fdr_qt, co_type, qt_type, pval_dir)
+    if network_output is not None:
+        network.write_graph(network_output, format=format)
+    return results, network
@@ -5,47 +5,96 @@ Preprocess the microbial feature tables to reduce less informative microbial fea
 - filter by prevalence 
 """
 
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
+from scipy import sparse
+
+from minet import feature_table
+
+logger = logging.getLogger(__name__)
 
 
 class Preprocessor:
-    def __init__(self, table) -> None:
+    def __init__(self, table, seed=None, n_jobs=None) -> None:
+        """
+        Initializes the preprocessor with a copy of the feature table
+
+        seed: random seed of the undersampling (random if None)
+        n_jobs: number of threads undersampling the samples (default: number of CPUs)
+        """
         self.table = table.copy()
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.n_jobs = n_jobs if n_jobs else os.cpu_count()
 
     def undersampling_by_depth(self, depth_cutoff=10000):
         """
         Undersamples sequences reads for each samples
+
+        Samples with less reads than depth_cutoff are dropped. Drawing depth_cutoff reads without replacement follows
+        the multivariate hypergeometric distribution of the read counts, so the undersampled counts are drawn directly
+        from the non-zero counts of each sample. Each sample has its own random generator spawned from the seed,
+        so the results do not depend on the number of threads (nor on the dense or sparse representation).
         """
-        print(depth_cutoff)
-        samples_to_drop = []
-        for sample in self.table.columns:
-            col = self.table[sample]
-            total_reads = col.sum()
-            if total_reads < depth_cutoff:
-                samples_to_drop.append(sample)
-                continue
-            else:
-                reads = col[col > 0].index.repeat(col[col > 0].values)
-                undersampled_reads = np.random.choice(
-                    reads, size=depth_cutoff, replace=False)
-                undersampled_col = pd.Series(undersampled_reads).value_counts()
-                undersampled_result = pd.Series(0, index=col.index)
-                undersampled_result[undersampled_col.index] = undersampled_col.values
-            self.table[sample] = undersampled_result
-
-        for sp in samples_to_drop:
-            self.table.drop(sp, axis=1, inplace=True)
+        logger.info('Undersampling to %d reads', depth_cutoff)
+        total_reads = np.asarray(self.table.sum(axis=0))
+        keep = total_reads >= depth_cutoff
+        columns = self.table.columns[keep]
+
+        if feature_table.is_sparse(self.table):
+            matrix = feature_table.feature_matrix(self.table).tocsc()[:, np.nonzero(keep)[0]]
+            matrix.sort_indices()
+            nz = [matrix.indices[matrix.indptr[k]:matrix.indptr[k + 1]] for k in range(matrix.shape[1])]
+            counts = [matrix.data[matrix.indptr[k]:matrix.indptr[k + 1]] for k in range(matrix.shape[1])]
+        else:
+            matrix = self.table.values[:, keep]
+            nz = [np.nonzero(matrix[:, k])[0] for k in range(matrix.shape[1])]
+            counts = [matrix[nz[k], k] for k in range(matrix.shape[1])]
+
+        seeds = self.seed_sequence.spawn(len(counts))
+
+        def undersample(k):
+            rng = np.random.default_rng(seeds[k])
+            col = np.rint(counts[k]).astype(np.int64)
+            return rng.multivariate_hypergeometric(col, depth_cutoff, method='marginals')
+
+        with ThreadPoolExecutor(self.n_jobs) as executor:
+            undersampled = list(executor.map(undersample, range(len(counts))))
+
+        if feature_table.is_sparse(self.table):
+            data = np.concatenate(undersampled + [np.zeros(0, dtype=np.int64)])
+            matrix = sparse.csc_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+            self.table = feature_table.from_matrix(matrix, self.table.index, columns)
+        else:
+            res = np.zeros(matrix.shape, dtype=np.int64)
+            for k in range(len(counts)):
+                res[nz[k], k] = undersampled[k]
+            self.table = pd.DataFrame(res, index=self.table.index, columns=columns)
 
     def filter_by_prevalence(self, prevalence_cutoff=0.1):
         """
         Filters ASVs by prevalence 
         """
-        print(self.table.shape)
         m = self.table.shape[1]
-        asvs_to_drop = []
-        for id, row in self.table.iterrows():
-            if float(np.count_nonzero(row)) / m <= prevalence_cutoff:
-                asvs_to_drop.append(id)
-        for asv in asvs_to_drop:
-            self.table.drop(asv, axis=0, inplace=True)
+        if feature_table.is_sparse(self.table):
+            matrix = feature_table.feature_matrix(self.table)
+            prevalence = np.diff(matrix.indptr) / float(m)
+            keep = prevalence > prevalence_cutoff
+            self.table = feature_table.from_matrix(matrix[keep], self.table.index[keep], self.table.columns)
+        else:
+            prevalence = np.count_nonzero(self.table.values, axis=1) / float(m)
+            self.table = self.table.loc[prevalence > prevalence_cutoff]
+        logger.info('Features with prevalence above %g: %d', prevalence_cutoff, self.table.shape[0])
+
+
+def cache_key(digest, depth, prevalence, seed):
+    """
+    Creates the key of a preprocessed table from the content hash of the input file and the preprocessing settings
+    """
+    settings = json.dumps([digest, depth, prevalence, seed])
+    return hashlib.blake2b(settings.encode(), digest_size=20).hexdigest()
@@ -0,0 +1,207 @@
+"""
+Quantitative association evaluation module
+
+This module calculates Pearson's correlation between the logarithm-transformed read counts of two microbial features.
+Only samples where both features have non-zero read counts are considered.
+
+- log_pearson: the correlation of two count vectors
+- log_pearson_matrix: the correlations of all pairs of features, calculated by masked matrix products over tiles of the feature table
+"""
+
+import warnings
+
+import numpy as np
+from scipy import sparse, special
+from scipy.stats import pearsonr
+
+# Minimum number of co-present samples for the correlation
+MIN_SAMPLES = 6
+
+
+def log_pearson(v1, v2):
+    """
+    Pearson's correlation of the logarithm-transformed read counts of co-present samples
+
+    Returns:
+        rho (float): Pearson's correlation coefficient (0 for less than MIN_SAMPLES samples or constant vectors).
+        p_value (float): The p-value of the correlation (1 for less than MIN_SAMPLES samples or constant vectors).
+        n (int): The number of samples where both features are present.
+    """
+    nz1 = set(np.nonzero(v1)[0])
+    nz2 = set(np.nonzero(v2)[0])
+    ci = list(nz1.intersection(nz2))
+
+    v1_nz = np.log(v1[ci])
+    v2_nz = np.log(v2[ci])
+
+    if len(ci) < MIN_SAMPLES:
+        rho = 0
+        pv_ps = 1.0
+    else:
+        sd1 = np.std(v1_nz)
+        sd2 = np.std(v2_nz)
+
+        if sd1 == 0 or sd2 == 0:
+            rho = 0
+            pv_ps = 1.
+        else:
+            rho, pv_ps = pearsonr(v1_nz, v2_nz)
+    return rho, pv_ps, len(ci)
+
+
+def log_pearson_matrix(table_a, table_b=None, block_size=512):
+    """
+    Pearson's correlation of the logarithm-transformed read counts for all pairs of features
+
+    The logarithm is calculated once per feature. For each tile of block_size x block_size features, the counts, sums,
+    sums of squares and cross-products over co-present samples are obtained from matrix products of the presence masks
+    and the logarithm-transformed values. The guards of log_pearson() are applied to every pair; pairs whose values
+    could be constant are re-evaluated with log_pearson().
+
+    Sparse count matrices are handled with sparse matrix products, so the work scales with the number of non-zero counts.
+
+    Parameters:
+    table_a (np.ndarray or scipy.sparse matrix): Feature x sample count matrix.
+    table_b (np.ndarray or scipy.sparse matrix, optional): Second feature x sample count matrix. If None, table_a is used.
+    block_size (int): Number of features per tile.
+
+    Returns:
+        rho (np.ndarray): Pearson's correlation coefficients (len(table_a) x len(table_b)).
+        p_value (np.ndarray): The p-values of the correlations.
+        n (np.ndarray): The number of samples where both features are present.
+    """
+    table_a = _as_float(table_a)
+    symmetric = table_b is None
+    table_b = table_a if symmetric else _as_float(table_b)
+
+    ma, la = _log_transform(table_a)
+    mb, lb = (ma, la) if symmetric else _log_transform(table_b)
+
+    ka, kb = table_a.shape[0], table_b.shape[0]
+    rho = np.zeros((ka, kb), dtype=float)
+    pv = np.ones((ka, kb), dtype=float)
+    n = np.zeros((ka, kb), dtype=np.int64)
+
+    for i0 in range(0, ka, block_size):
+        i1 = min(i0 + block_size, ka)
+        for j0 in range(0, kb, block_size):
+            j1 = min(j0 + block_size, kb)
+            if symmetric and j0 > i0:
+                continue
+
+            r, p, c = _log_pearson_tile(ma[i0:i1], la[i0:i1], mb[j0:j1], lb[j0:j1])
+
+            # Re-evaluates possibly constant vectors exactly
+            for i, j in zip(*np.nonzero(np.isnan(r))):
+                r[i, j], p[i, j], c[i, j] = log_pearson(_row(table_a, i0 + i), _row(table_b, j0 + j))
+
+            rho[i0:i1, j0:j1] = r
+            pv[i0:i1, j0:j1] = p
+            n[i0:i1, j0:j1] = c
+            if symmetric and j0 < i0:
+                rho[j0:j1, i0:i1] = r.T
+                pv[j0:j1, i0:i1] = p.T
+                n[j0:j1, i0:i1] = c.T
+    return rho, pv, n
+
+
+def _as_float(table):
+    """
+    Converts a count matrix into a float numpy array or CSR matrix without explicit zeros.
+    """
+    if sparse.issparse(table):
+        table = sparse.csr_matrix(table, dtype=float, copy=True)
+        table.eliminate_zeros()
+        return table
+    return np.asarray(table, dtype=float)
+
+
+def _row(table, i):
+    """
+    Returns a row of a dense or sparse matrix as a dense vector.
+    """
+    if sparse.issparse(table):
+        return table[i].toarray().ravel()
+    return table[i]
+
+
+def _log_transform(table):
+    """
+    Returns the presence mask and the centered logarithm of non-zero counts (0 for absent samples).
+
+    Centering by the mean of each feature does not change the correlations and reduces the loss of precision in the sums.
+    Sparse matrices keep their sparsity structure.
+    """
+    if sparse.issparse(table):
+        counts = np.diff(table.indptr)
+        lt = table.copy()
+        lt.data = np.log(lt.data)
+        means = np.divide(np.asarray(lt.sum(axis=1)).ravel(), counts, out=np.zeros(table.shape[0]), where=counts > 0)
+        lt.data -= np.repeat(means, counts)
+        mask = table.copy()
+        mask.data[:] = 1.
+        return mask, lt
+
+    mask = table != 0
+    lt = np.zeros(table.shape, dtype=float)
+    lt[mask] = np.log(table[mask])
+
+    counts = mask.sum(axis=1)
+    means = np.divide(lt.sum(axis=1), counts, out=np.zeros(len(table)), where=counts > 0)
+    lt = np.where(mask, lt - means[:, None], 0.)
+    return mask.astype(float), lt
+
+
+def _log_pearson_tile(ma, la, mb, lb):
+    """
+    Calculates the correlations of a tile from masked sums, sums of squares and cross-products.
+
+    Pairs with possibly constant values are marked with NaN.
+    """
+    n = np.rint(_dot(ma, mb))
+    sx = _dot(la, mb)
+    sy = _dot(ma, lb)
+    sxx = _dot(_square(la), mb)
+    syy = _dot(ma, _square(lb))
+    sxy = _dot(la, lb)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vx = sxx - sx * sx / n
+        vy = syy - sy * sy / n
+        cov = sxy - sx * sy / n
+        r = cov / np.sqrt(vx * vy)
+    r = np.clip(r, -1., 1.)
+
+    # p-values from the beta distribution of r on (-1, 1) with a = b = n/2 - 1
+    ab = n / 2 - 1
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        p = 2 * special.betainc(ab, ab, (1 - np.abs(r)) / 2)
+    p = np.minimum(p, 1.)
+
+    enough = n >= MIN_SAMPLES
+    suspect = enough & ((vx <= 1e-9 * sxx) | (vy <= 1e-9 * syy))
+
+    r = np.where(enough, r, 0.)
+    p = np.where(enough, p, 1.)
+    r[suspect] = np.nan
+    return r, p, n.astype(np.int64)
+
+
+def _dot(a, b):
+    """
+    Returns the dense matrix product a @ b.T of dense or sparse matrices.
+    """
+    res = a @ b.T
+    if sparse.issparse(res):
+        return res.toarray()
+    return res
+
+
+def _square(a):
+    """
+    Element-wise square of a dense or sparse matrix.
+    """
+    if sparse.issparse(a):
+        return a.multiply(a).tocsr()
+    return a * a
@@ -0,0 +1,99 @@
+"""
+Synthetic data module
+
+This module generates microbial feature tables (features x samples) with known structure for tests and benchmarks.
+
+- generate_feature_table: read counts with configurable sparsity and sequencing depths, and planted directional pairs
+- generate_results: interaction analysis results of random pairs of features
+"""
+
+import numpy as np
+import pandas as pd
+
+from minet import feature_table
+
+
+def generate_feature_table(n_features=100, n_samples=50, sparsity=0.7, depth=(20000, 0.3), n_directional=0,
+                           seed=None, sparse_table=False):
+    """
+    Generates a microbial feature table with planted directional pairs
+
+    Parameters:
+    n_features (int): Number of features (ASVs).
+    n_samples (int): Number of samples.
+    sparsity (float): Mean fraction of samples where a feature is absent.
+    depth (tuple): Median and log-scale standard deviation of the log-normal sequencing depths of the samples.
+    n_directional (int): Number of directional pairs (source, target), where the target is only present in samples
+        with the source. The pairs are made of distinct features.
+    seed (int, optional): Random seed.
+    sparse_table (bool): Returns a sparse table (see feature_table.from_matrix).
+
+    Returns:
+        table (pd.DataFrame): Read counts of the features (rows) in the samples (columns).
+        pairs (list): The directional pairs of the feature IDs (source, target).
+    """
+    if 2 * n_directional > n_features:
+        raise ValueError('The directional pairs need %d features' % (2 * n_directional))
+
+    rng = np.random.default_rng(seed)
+
+    # Presence of the features with prevalences around 1 - sparsity
+    prevalence = rng.beta(2 * (1 - sparsity), 2 * sparsity, size=n_features) if 0 < sparsity < 1 \
+        else np.full(n_features, 1. - sparsity)
+    present = rng.random((n_features, n_samples)) < prevalence[:, None]
+
+    # Targets are only present with their sources
+    features = rng.permutation(n_features)
+    sources, targets = features[:n_directional], features[n_directional:2 * n_directional]
+    present[sources] |= present[targets]
+    present[targets] &= present[sources]
+
+    # Read counts of the present features drawn from their relative abundances
+    abundance = rng.lognormal(0, 1.5, size=n_features)
+    depths = np.maximum(1, rng.lognormal(np.log(depth[0]), depth[1], size=n_samples)).astype(np.int64)
+    counts = np.zeros((n_features, n_samples), dtype=np.int64)
+    for k in range(n_samples):
+        nz = np.nonzero(present[:, k])[0]
+        if len(nz):
+            counts[nz, k] = rng.multinomial(depths[k], abundance[nz] / abundance[nz].sum())
+
+    index = pd.Index(['ASV%06d' % i for i in range(n_features)], name='#OTU ID')
+    columns = pd.Index(['S%06d' % k for k in range(n_samples)])
+    pairs = [(index[s], index[t]) for s, t in zip(sources, targets)]
+    if sparse_table:
+        from scipy import sparse
+        return feature_table.from_matrix(sparse.csr_matrix(counts), index, columns), pairs
+    return pd.DataFrame(counts, index=index, columns=columns), pairs
+
+
+def generate_results(n_features=100, n_pairs=None, seed=None):
+    """
+    Generates interaction analysis results (see interaction_analysis.RESULT_COLUMNS) with adjusted p-values
+
+    The p-values are uniform, except for a tenth of the pairs with small p-values.
+    """
+    rng = np.random.default_rng(seed)
+    n_all = n_features * (n_features - 1) // 2
+    n_pairs = n_all if n_pairs is None else min(n_pairs, n_all)
+
+    k = rng.choice(n_all, size=n_pairs, replace=False) if n_pairs < n_all else np.arange(n_all)
+    k.sort()
+    i = ((1 + np.sqrt(1 + 8 * k)) / 2).astype(np.int64)
+    i -= i * (i - 1) // 2 > k
+    j = k - i * (i - 1) // 2
+
+    ids = np.array(['ASV%06d' % x for x in range(n_features)], dtype=object)
+    signal = rng.random(n_pairs) < 0.1
+
+    def pvalues():
+        return np.where(signal, rng.random(n_pairs) * 1e-4, rng.random(n_pairs))
+
+    df = pd.DataFrame({'Feature1': ids[i], 'Feature2': ids[j],
+                       'N12': rng.integers(0, 50, n_pairs), 'N1': 50, 'N2': 50,
+                       'LogOddsRatio': rng.normal(size=n_pairs), 'Rho': rng.uniform(-1, 1, n_pairs),
+                       'P-value(FisherExact)': pvalues(), 'P-value(Pearson)': pvalues(),
+                       'LogRatio12': rng.normal(size=n_pairs), 'LogRatio21': rng.normal(size=n_pairs),
+                       'P-value(12)': pvalues(), 'P-value(21)': pvalues()})
+    df['Adjusted-P(FisherExact)'] = np.minimum(1, df['P-value(FisherExact)'] * 10)
+    df['Adjusted-P(Pearson)'] = np.minimum(1, df['P-value(Pearson)'] * 10)
+    return df
@@ -2,26 +2,76 @@
 This module provides utilities for other analyses.
 """
 
+import logging
+import queue
+import threading
+from collections import OrderedDict
 from multiprocessing import Process, Queue
+from multiprocessing.managers import BaseManager
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 
 class Manager:
     """
     A manager for multi-processing jobs.
+
+    The depths of the queues are sampled as the results arrive in stream_jobs (see queue_stats).
     """
-    def __init__(self, f_job, n_worker=1):
+    def __init__(self, f_job, n_worker=1, args=()):
+        """
+        Initializes the job queues and deploys the workers.
+
+        f_job is called as f_job(q_job, q_result, *args) in each worker.
+        """
         self.n_worker = n_worker
         self.f_job = f_job
+        self.args = tuple(args)
 
         self.q_job = Queue()
         self.q_result = Queue()
+        self.workers = []
+        self.queue_stats = {'jobs': 0, 'max_pending': 0, 'max_job_queue': 0, 'max_result_queue': 0}
         self.create_worker()
 
     def create_worker(self):
         for i in range(self.n_worker):
-            p = Process(target=self.f_job, args=(self.q_job, self.q_result, ))
+            p = Process(target=self.f_job, args=(self.q_job, self.q_result, ) + self.args, daemon=True)
             p.start()
-        print('%s workers were deployed' % self.n_worker)
+            self.workers.append(p)
+        logger.info('%s workers were deployed', self.n_worker)
+
+    def terminate(self):
+        """
+        Stops the workers that are still running (e.g. after an error in the main process).
+        """
+        for p in self.workers:
+            if p.is_alive():
+                p.terminate()
+
+    def queue_depths(self):
+        """
+        Returns the number of jobs and results waiting in the queues (None where qsize() is not supported, e.g. macOS).
+        """
+        depths = {}
+        for name, q in (('job_queue', self.q_job), ('result_queue', self.q_result)):
+            try:
+                depths[name] = q.qsize()
+            except NotImplementedError:
+                depths[name] = None
+        return depths
+
+    def _sample_queues(self, pending):
+        stats = self.queue_stats
+        stats['max_pending'] = max(stats['max_pending'], pending)
+        depths = self.queue_depths()
+        for name in ('job_queue', 'result_queue'):
+            if depths[name] is not None:
+                stats['max_' + name] = max(stats['max_' + name], depths[name])
+        logger.debug('Pending jobs: %d, queue depths: %s', pending, depths)
 
     def fill_jobs(self, jobs):
         self.n_jobs = len(jobs)
@@ -35,3 +85,152 @@ class Manager:
         for i in range(self.n_jobs):
             res.append(self.q_result.get())
         return res
+
+    def stream_jobs(self, jobs, n_pending=None, poll_interval=1.0):
+        """
+        Feeds jobs lazily and yields the results as they arrive.
+
+        At most n_pending jobs (default: twice the number of workers) are queued or running at a time, so the jobs are
+        generated only when the workers are ready for them. The workers are stopped after the last job.
+        While waiting for a result, the workers are checked every poll_interval seconds, and a RuntimeError is raised
+        if a worker exited before the last job (e.g. killed or failed), since its job will never be reported.
+        """
+        if n_pending is None:
+            n_pending = 2 * self.n_worker
+
+        jobs = iter(jobs)
+        pending = 0
+        for j in jobs:
+            self.q_job.put({'type': 'JOB', 'value': j})
+            pending += 1
+            if pending >= n_pending:
+                break
+
+        while pending > 0:
+            self._sample_queues(pending)
+            res = self._get_result(poll_interval)
+            pending -= 1
+            self.queue_stats['jobs'] += 1
+            for j in jobs:
+                self.q_job.put({'type': 'JOB', 'value': j})
+                pending += 1
+                break
+            yield res
+
+        for i in range(self.n_worker):
+            self.q_job.put({'type': 'CONTROL', 'value': 'END'})
+
+    def _get_result(self, poll_interval):
+        while True:
+            try:
+                return self.q_result.get(timeout=poll_interval)
+            except queue.Empty:
+                pass
+            for p in self.workers:
+                if not p.is_alive():
+                    raise RuntimeError('The worker %d exited with code %s before the last job' % (p.pid, p.exitcode))
+
+
+class LRUCache:
+    """
+    A bounded cache with least-recently-used eviction.
+
+    Hits and misses are counted to size the cache. The methods are guarded by a lock, since the CacheManager
+    serves the workers from concurrent threads.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value or None if the key is not present.
+        """
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Stores a value and evicts the least recently used values beyond maxsize.
+        """
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the size of the cache.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self.data), 'maxsize': self.maxsize}
+
+
+class CacheManager(BaseManager):
+    """
+    A server process sharing LRUCache objects across worker processes.
+    """
+    pass
+
+
+CacheManager.register('LRUCache', LRUCache)
+
+
+class SharedArray:
+    """
+    A numpy array placed in shared memory.
+
+    The process owning the array creates it with SharedArray.create() and passes the picklable spec to the workers,
+    which attach to the same memory with SharedArray.attach() without copying the data.
+    """
+    def __init__(self, shm, shape, dtype, owner=False):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, array):
+        """
+        Copies an array into a new shared memory block.
+        """
+        array = np.ascontiguousarray(array)
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype, owner=True)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attaches to the shared memory block described by spec.
+        """
+        name, shape, dtype = spec
+        return cls(SharedMemory(name=name), shape, dtype)
+
+    @property
+    def spec(self):
+        """
+        Picklable description of the shared array: (name, shape, dtype).
+        """
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    def close(self):
+        """
+        Detaches from the shared memory, and releases it in the owner process.
+        """
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
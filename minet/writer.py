@@ -0,0 +1,78 @@
+"""
+Result file handling module
+
+This module writes interaction analysis results incrementally, so that the results of long runs are kept on disk
+while the analysis proceeds.
+"""
+
+import pandas as pd
+
+
+class ResultWriter:
+    """
+    Appends result rows to a tab-separated file in batches.
+    """
+
+    def __init__(self, filename, columns, batch_size=100000, append=False):
+        """
+        Opens the result file and writes the header (unless results are appended to an existing file).
+
+        Parameters:
+        filename (str): Output file.
+        columns (list): Column names of the result rows.
+        batch_size (int): Number of buffered rows written at once.
+        append (bool): Appends to an existing file without the header.
+        """
+        self.filename = filename
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.n_rows = 0
+
+        self.buffer = []
+        self.n_buffered = 0
+
+        self.f = open(filename, 'a' if append else 'w')
+        if not append:
+            self.f.write('\t'.join(self.columns) + '\n')
+            self.f.flush()
+
+    def write(self, df):
+        """
+        Buffers the result rows (pd.DataFrame with the result columns) and writes them when the batch is full.
+        """
+        self.buffer.append(df[self.columns])
+        self.n_buffered += len(df)
+        if self.n_buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows to the file.
+        """
+        if self.buffer:
+            pd.concat(self.buffer).to_csv(self.f, sep='\t', header=False, index=False)
+            self.n_rows += self.n_buffered
+            self.buffer = []
+            self.n_buffered = 0
+        self.f.flush()
+
+    def tell(self):
+        """
+        Returns the size of the written part of the file (after flush).
+        """
+        return self.f.tell()
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the file.
+        """
+        self.flush()
+        self.f.close()
+
+
+def read_results(filename, **kwargs):
+    """
+    Reads the result rows written by ResultWriter. Floats are parsed without loss of precision.
+    """
+    return pd.read_csv(filename, sep='\t', float_precision='round_trip',
+                       dtype={'Feature1': str, 'Feature2': str}, **kwargs)
@@ -0,0 +1,51 @@
+"""
+Tests for co-occurrence evaluation
+"""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from minet import cooccurrence
+
+
+class TestCooccurrence(unittest.TestCase):
+    def test_coocurrence_matrix(self):
+        current_dir = os.path.dirname(__file__)
+
+        table = pd.read_csv(
+            f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', sep='\t', header=0, index_col=0)
+        table = table.iloc[:40, :].values
+
+        n12, n1, n2, odds_ratio, pv = cooccurrence.coocurrence_matrix(table)
+        for i in range(len(table)):
+            for j in range(i):
+                o, p = cooccurrence.coocurrence(table[i], table[j])
+                self.assertEqual(o, odds_ratio[i, j])
+                self.assertEqual(p, pv[i, j])
+                self.assertEqual(n12[i, j], np.count_nonzero(table[i] * table[j]))
+                self.assertEqual(n1[i, j], np.count_nonzero(table[i]))
+                self.assertEqual(n2[i, j], np.count_nonzero(table[j]))
+
+    def test_fisher_pvalues_degenerate(self):
+        rng = np.random.default_rng(1)
+        table = rng.integers(0, 3, size=(10, 12))
+        table[0, :] = 5  # present in every sample
+        table[1, :] = 0  # absent in every sample
+
+        n12, n1, n2, odds_ratio, pv = cooccurrence.coocurrence_matrix(table)
+        for i in range(len(table)):
+            for j in range(len(table)):
+                o, p = cooccurrence.coocurrence(table[i], table[j])
+                self.assertEqual(o, odds_ratio[i, j])
+                self.assertEqual(p, pv[i, j])
+
+    def test_fisher_pvalues_cache(self):
+        n12 = np.arange(0, 30)
+        with mock.patch.object(cooccurrence, '_FISHER_CACHE', cooccurrence.LRUCache(10)) as cache:
+            pv = cooccurrence.fisher_pvalues(n12, 30, 30, 60)
+            self.assertEqual(len(cache.data), 10)
+            self.assertTrue(all(type(v) is int for key in cache.data for v in key))
+            np.testing.assert_array_equal(cooccurrence.fisher_pvalues(n12, 30, 30, 60), pv)
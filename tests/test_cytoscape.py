@@ -0,0 +1,54 @@
+"""
+Tests for the Cytoscape graph model
+"""
+
+import io
+import unittest
+from contextlib import redirect_stdout
+from xml.etree import ElementTree
+
+from minet import cytoscape
+
+
+class TestCytoscape(unittest.TestCase):
+    def test_add_nodes_edges(self):
+        cx = cytoscape.CytoscapeXGMML()
+        cx.add_nodes([('a', {'name': 'a'}), ('b', {'name': 'b'}), (3, {'name': '3'})])
+        cx.add_edges([('a', 'b', {'Rho': 0.5}), ('b', 3, {'Rho': 0.1})])
+
+        self.assertEqual(cx.Graph.get_node_index('3'), 2)
+        self.assertEqual(cx.Graph.get_node_index('c'), -1)
+        self.assertEqual(cx.Graph.get_edge_index('b', '3'), 1)
+        self.assertEqual(cx.Graph.get_edge_index('b', 'a'), -1)
+
+        # Duplicated nodes and edges, and edges of unknown nodes are not added
+        out = io.StringIO()
+        with redirect_stdout(out):
+            cx.add_node('a', {'name': 'x'})
+            cx.add_edge('a', 'b', {'Rho': 0.9})
+            cx.add_edge('a', 'c', {})
+        self.assertIn('Warning: the node a is already present', out.getvalue())
+        self.assertIn('Warning: the edge (a, b) is found', out.getvalue())
+        self.assertIn('Warning: the nodes in the edge not found.', out.getvalue())
+        self.assertEqual(len(cx.Graph.Nodes), 3)
+        self.assertEqual(len(cx.Graph.Edges), 2)
+        self.assertEqual(cx.Graph.Nodes[0].properties, {'name': 'a'})
+        self.assertEqual(cx.Graph.Edges[0].properties, {'Rho': 0.5})
+
+    def test_write_graph(self):
+        cx = cytoscape.CytoscapeXGMML()
+        cx.add_node('a', {'name': 'a', 'size': 2})
+        cx.add_node('b<"&>', {'name': 'b<"&>', 'weight': 0.5})
+        cx.add_edge('a', 'b<"&>', {'Rho': 0.5})
+
+        out = io.StringIO()
+        cx.write_graph(out)
+        self.assertEqual(out.getvalue(), cx.print_graph())
+        self.assertIn('<node id="b&lt;&quot;&amp;&gt;" label="b&lt;&quot;&amp;&gt;">', out.getvalue())
+        self.assertIn('<att name="size" type="integer" value="2"/>', out.getvalue())
+        self.assertIn('<att name="weight" type="real" value="0.500000"/>', out.getvalue())
+        self.assertIn('<edge source="a" target="b&lt;&quot;&amp;&gt;" label="gg">', out.getvalue())
+
+        # The output is well-formed XML
+        root = ElementTree.fromstring(out.getvalue().split('\n', 1)[1])
+        self.assertEqual(root.findall('{http://www.cs.rpi.edu/XGMML}node')[1].get('id'), 'b<"&>')
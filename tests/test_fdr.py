@@ -0,0 +1,43 @@
+"""
+Tests for FDR calculation
+"""
+
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from statsmodels.stats import multitest
+from minet import fdr
+
+
+class TestFDR(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = pd.DataFrame({'P-value(A)': rng.random(1000) ** 3,
+                                  'P-value(B)': np.round(rng.random(1000), 2)})  # ties
+
+    def test_bh_adjust(self):
+        for c in self.data.columns:
+            expected = multitest.multipletests(self.data[c].values, method='fdr_bh')[1]
+            np.testing.assert_array_equal(fdr.bh_adjust(self.data[c].values), expected)
+
+    def test_adjust(self):
+        f = fdr.FDR()
+        expected = f.calc(self.data, pvalue_index='P-value(A)')[0]
+        data = f.adjust(self.data.copy(), ['P-value(A)', 'P-value(B)'])
+        np.testing.assert_array_equal(data['Adjusted-P(P-value(A))'].values, expected['Adjusted-P'].values)
+        self.assertListEqual(list(data.columns[2:]), ['Adjusted-P(P-value(A))', 'Adjusted-P(P-value(B))'])
+
+    def test_adjust_files(self):
+        f = fdr.FDR()
+        expected = f.adjust(self.data.copy(), ['P-value(A)', 'P-value(B)'], ['Adjusted-P(A)', 'Adjusted-P(B)'])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.data.iloc[:300].to_csv(f'{tmp_dir}/a.tsv', sep='\t')
+            self.data.iloc[300:].to_csv(f'{tmp_dir}/b.tsv', sep='\t')
+            n = f.adjust_files([f'{tmp_dir}/a.tsv', f'{tmp_dir}/b.tsv'], f'{tmp_dir}/out.tsv',
+                               ['P-value(A)', 'P-value(B)'], ['Adjusted-P(A)', 'Adjusted-P(B)'],
+                               chunksize=128, index_col=0, float_precision='round_trip')
+            res = pd.read_csv(f'{tmp_dir}/out.tsv', sep='\t', index_col=0, float_precision='round_trip')
+        self.assertEqual(n, 1000)
+        pd.testing.assert_frame_equal(res, expected, check_exact=True)
@@ -0,0 +1,85 @@
+"""
+Tests for feature table handling
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from minet import feature_table
+
+
+class TestFeatureTable(unittest.TestCase):
+    def setUp(self):
+        current_dir = os.path.dirname(__file__)
+        self.filename = f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv'
+
+    def test_read_table(self):
+        table = feature_table.read_table(self.filename)
+        sparse_table = feature_table.read_table(self.filename, sparse_table=True, chunk_values=100000)
+
+        self.assertFalse(feature_table.is_sparse(table))
+        self.assertTrue(feature_table.is_sparse(sparse_table))
+        self.assertListEqual(list(sparse_table.index), list(table.index))
+        self.assertListEqual(list(sparse_table.columns), list(table.columns))
+        np.testing.assert_array_equal(sparse_table.sparse.to_dense().values, table.values)
+
+    def test_feature_matrix(self):
+        table = feature_table.read_table(self.filename)
+        sparse_table = feature_table.read_table(self.filename, sparse_table=True)
+
+        matrix = feature_table.feature_matrix(sparse_table)
+        self.assertTrue(sparse.isspmatrix_csr(matrix))
+        self.assertEqual(matrix.nnz, np.count_nonzero(table.values))
+        np.testing.assert_array_equal(matrix.toarray(), feature_table.feature_matrix(table))
+        np.testing.assert_array_equal(feature_table.row(matrix, 3), table.values[3])
+
+    def test_from_matrix(self):
+        matrix = sparse.random(20, 10, density=0.2, format='csr', random_state=0)
+        table = feature_table.from_matrix(matrix, pd.Index(range(20)), pd.Index(range(10)))
+
+        self.assertTrue(all(t.fill_value == 0 for t in table.dtypes))
+        np.testing.assert_array_equal(feature_table.feature_matrix(table).toarray(), matrix.toarray())
+
+    def test_binary_cache(self):
+        table = feature_table.read_table(self.filename)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = feature_table.TableCache(cache_dir)
+            for sparse_table in [False, True]:
+                first = feature_table.read_table(self.filename, sparse_table=sparse_table, cache=cache)
+                second = feature_table.read_table(self.filename, sparse_table=sparse_table, cache=cache)
+                self.assertEqual(feature_table.is_sparse(second), sparse_table)
+                pd.testing.assert_index_equal(second.index, table.index)
+                pd.testing.assert_index_equal(second.columns, table.columns)
+                for t in [first, second]:
+                    matrix = feature_table.feature_matrix(t)
+                    np.testing.assert_array_equal(matrix.toarray() if sparse_table else matrix, table.values)
+            self.assertEqual(len(os.listdir(os.path.join(cache_dir, 'tables'))), 2)
+
+            # Counts are memory-mapped with a compact integer type
+            path = os.path.join(cache_dir, 'tables', feature_table.file_hash(self.filename) + '.dense')
+            counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+            self.assertIsInstance(counts, np.memmap)
+            self.assertTrue(np.issubdtype(counts.dtype, np.unsignedinteger))
+
+    def test_table_cache_eviction(self):
+        tables = [pd.DataFrame(np.full((10, 10), k), index=[f'ASV{i}' for i in range(10)]) for k in range(3)]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = feature_table.TableCache(cache_dir)
+            cache.put('tables', 'a', tables[0])
+            cache.put('tables', 'b', tables[1])
+            size = sum(os.path.getsize(os.path.join(cache_dir, 'tables', 'a', f))
+                       for f in os.listdir(os.path.join(cache_dir, 'tables', 'a')))
+
+            # 'b' is the least recently used table
+            os.utime(os.path.join(cache_dir, 'tables', 'b', 'meta.json'), (0, 0))
+            self.assertIsNotNone(cache.get('tables', 'a'))
+            cache.max_size = 2 * size
+            cache.put('tables', 'c', tables[2])
+
+            self.assertIsNone(cache.get('tables', 'b'))
+            np.testing.assert_array_equal(cache.get('tables', 'a').values, tables[0].values)
+            np.testing.assert_array_equal(cache.get('tables', 'c').values, tables[2].values)
@@ -5,7 +5,25 @@ Tests for interaction analysis
 import os
 import logging
 import unittest
-from minet import interaction_analysis
+import itertools
+import multiprocessing
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from minet import interaction_analysis, preprocess, writer, network, utility
+
+
+def random_table(presence=0.6, n_features=12, index=None):
+    """
+    Returns a random feature table of n_features x 40 samples with the features present in a fraction presence of
+    the samples, named ASV0, ASV1, ... unless the index is given (e.g. integer IDs as in closed-reference OTU tables)
+    """
+    rng = np.random.default_rng(0)
+    table = rng.integers(0, 20, size=(n_features, 40)) * (rng.random((n_features, 40)) < presence)
+    return pd.DataFrame(table, index=index if index is not None else ['ASV%d' % i for i in range(n_features)])
 
 
 class TestInteractionAnalysis(unittest.TestCase):
@@ -16,6 +34,26 @@ class TestInteractionAnalysis(unittest.TestCase):
         analyzer.load_feature_table(
             f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', depth=5000, prevalence=0.1)
         
+    def test_load_feature_table_cache(self):
+        current_dir = os.path.dirname(__file__)
+        filename = f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv'
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            analyzer = interaction_analysis.Analyzer()
+            analyzer.load_feature_table(filename, depth=1000, prevalence=0.3, seed=1, cache_dir=cache_dir)
+
+            # The preprocessing is skipped for the same file and settings
+            cached = interaction_analysis.Analyzer()
+            with mock.patch('minet.preprocess.Preprocessor') as preprocessor:
+                cached.load_feature_table(filename, depth=1000, prevalence=0.3, seed=1, cache_dir=cache_dir)
+                preprocessor.assert_not_called()
+            pd.testing.assert_frame_equal(cached.asv_table, analyzer.asv_table, check_dtype=False)
+
+            with mock.patch('minet.preprocess.Preprocessor', wraps=preprocess.Preprocessor) as preprocessor:
+                cached.load_feature_table(filename, depth=1000, prevalence=0.4, seed=1, cache_dir=cache_dir)
+                preprocessor.assert_called_once()
+            self.assertEqual(len(os.listdir(f'{cache_dir}/preprocessed')), 2)
+
     def test_evaluate_feature_association(self):
         current_dir = os.path.dirname(__file__)
 
@@ -24,3 +62,302 @@ class TestInteractionAnalysis(unittest.TestCase):
             f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', depth=1000, prevalence=0.3, preprocessing=True)
         analyzer.evaluate_feature_association(
             f'{current_dir}/data/conditional_occurrence_directionality/result.tsv')
+
+    def test_evaluate_feature_association_exact(self):
+        current_dir = os.path.dirname(__file__)
+
+        analyzer = interaction_analysis.Analyzer()
+        analyzer.load_feature_table(
+            f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', depth=1000, prevalence=0.3, preprocessing=True)
+        analyzer.evaluate_feature_association(
+            f'{current_dir}/data/conditional_occurrence_directionality/result_exact.tsv', directionality='exact')
+
+    def test_evaluate_feature_association_null_cache(self):
+        rng = np.random.default_rng(0)
+        table = pd.DataFrame(rng.integers(0, 4, size=(8, 30)),
+                             index=['ASV%d' % i for i in range(8)])
+        table.iloc[4:, :] = table.iloc[:4, ::-1].values  # pairs sharing marginal counts
+
+        analyzer = interaction_analysis.Analyzer()
+        analyzer.asv_table = table
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            analyzer.evaluate_feature_association(
+                f'{tmp_dir}/result.tsv', null_cache_size=16)
+            res = pd.read_csv(f'{tmp_dir}/result.tsv', sep='\t', index_col=0)
+        self.assertEqual(len(res), 28)
+        self.assertTrue(((res['P-value(12)'] > 0) & (res['P-value(12)'] <= 1)).all())
+
+        # The cache manager is stopped when the evaluation fails (while the frames of the error are kept)
+        with mock.patch.object(utility.Manager, 'stream_jobs', side_effect=RuntimeError):
+            try:
+                analyzer.evaluate_feature_association(None, null_cache_size=16)
+            except RuntimeError:
+                managers = [p for p in multiprocessing.active_children() if p.name.startswith('CacheManager')]
+            else:
+                self.fail('The evaluation did not fail')
+        self.assertListEqual(managers, [])
+
+    def test_evaluate_pairs(self):
+        table = random_table().values
+
+        res_matrix = interaction_analysis.evaluate_pairs(table, 3, 9, 0, 6, engine='matrix', directionality='exact')
+        res_pair = interaction_analysis.evaluate_pairs(table, 3, 9, 0, 6, engine='pair', directionality='exact')
+        self.assertEqual(len(res_matrix), 3 + 4 + 5 + 6 * 3)
+        np.testing.assert_array_equal(res_matrix[:, :2], res_pair[:, :2])
+        np.testing.assert_allclose(res_matrix, res_pair, rtol=1e-9)
+
+    def test_evaluate_pairs_sparse(self):
+        table = random_table(0.3).values
+
+        shared, matrix = interaction_analysis.attach_table(
+            interaction_analysis.share_table(sparse.csr_matrix(table, dtype=float))[1])
+        for engine in ['matrix', 'pair']:
+            res_dense = interaction_analysis.evaluate_pairs(table, 0, 12, 0, 12, engine=engine, directionality='exact')
+            res_sparse = interaction_analysis.evaluate_pairs(matrix, 0, 12, 0, 12, engine=engine, directionality='exact')
+            np.testing.assert_allclose(res_sparse, res_dense, rtol=1e-9)
+        for sa in shared:
+            sa.close()
+
+    def test_evaluate_pairs_prescreen(self):
+        rng = np.random.default_rng(1)
+        table = random_table(0.5).to_numpy(copy=True)
+        table[6:] = 2 * table[:6] + (table[:6] > 0) * rng.integers(0, 5, size=(6, 40))  # associated pairs
+
+        res = interaction_analysis.evaluate_pairs(table, 0, 12, 0, 12, directionality='exact')
+        pruned = interaction_analysis.prescreen_mask(res[:, 2], res[:, 7], 0.05)
+        self.assertTrue(pruned.any() and not pruned.all())
+        ix_list = np.array(['ASV%d' % i for i in range(12)], dtype=object)
+        expected = interaction_analysis.adjust_pvalues(interaction_analysis.result_table(res, ix_list))
+        for engine in ['matrix', 'pair']:
+            res_ps = interaction_analysis.evaluate_pairs(table, 0, 12, 0, 12, engine=engine, directionality='exact',
+                                                         prescreen=0.05)
+            # Only the directionality tests of the pruned pairs are skipped
+            np.testing.assert_allclose(res_ps[:, :11], res[:, :11], rtol=1e-9)
+            np.testing.assert_allclose(res_ps[~pruned], res[~pruned], rtol=1e-9)
+            np.testing.assert_array_equal(res_ps[pruned][:, [11, 12]], [[1, 1]] * np.count_nonzero(pruned))
+
+            # Same adjusted p-values and network edges as without the prescreen
+            df = interaction_analysis.adjust_pvalues(interaction_analysis.result_table(res_ps, ix_list))
+            for c in ['Adjusted-P(FisherExact)', 'Adjusted-P(Pearson)']:
+                np.testing.assert_allclose(df[c].values, expected[c].values, rtol=1e-9)
+            for fdr_co, fdr_qt in [(0.05, 0.05), (0.05, 0.5), (0.01, 1)]:
+                nt, nt_ps = network.Network(), network.Network()
+                nt.load_associations(expected, fdr_co, fdr_qt, 'all', 'all')
+                nt_ps.load_associations(df, fdr_co, fdr_qt, 'all', 'all')
+                self.assertGreater(len(nt.edges), 0)
+                self.assertListEqual(list(nt_ps.edges), list(nt.edges))
+
+    def test_pair_tiles(self):
+        pairs = set()
+        for i0, i1, j0, j1 in interaction_analysis.pair_tiles(10, 3):
+            for i in range(i0, i1):
+                for j in range(j0, min(j1, i)):
+                    self.assertNotIn((i, j), pairs)
+                    pairs.add((i, j))
+        self.assertEqual(pairs, {(i, j) for i in range(10) for j in range(i)})
+
+        pairs = set()
+        for i0, i1, j0, j1 in interaction_analysis.pair_tiles(10, 3, rows=(4, 8)):
+            for i in range(i0, i1):
+                for j in range(j0, min(j1, i)):
+                    self.assertNotIn((i, j), pairs)
+                    pairs.add((i, j))
+        self.assertEqual(pairs, {(i, j) for i in range(4, 8) for j in range(i)})
+
+    def test_shard_rows(self):
+        bounds = [interaction_analysis.shard_rows(100, k, 4) for k in range(1, 5)]
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], 100)
+        for (r0, r1), (s0, s1) in zip(bounds, bounds[1:]):
+            self.assertEqual(r1, s0)
+        n_pairs = [(r1 * (r1 - 1) - r0 * (r0 - 1)) // 2 for r0, r1 in bounds]
+        self.assertLess(max(n_pairs) - min(n_pairs), 100)
+
+    def test_shard(self):
+        # Feature names and integer feature IDs
+        for index in [None, np.arange(100, 112)]:
+            table = random_table(index=index)
+            with self.subTest(index=index):
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    analyzer = interaction_analysis.Analyzer()
+                    analyzer.asv_table = table
+                    analyzer.evaluate_feature_association(f'{tmp_dir}/result.tsv', seed=7)
+
+                    shards = []
+                    for k in [1, 2, 3]:
+                        analyzer.evaluate_feature_association(f'{tmp_dir}/result.{k}.tsv', seed=7, max_memory=0.01,
+                                                              shard=(k, 3))
+                        shards.append(f'{tmp_dir}/result.{k}.tsv')
+                    interaction_analysis.merge_results(shards, f'{tmp_dir}/merged.tsv', chunksize=10)
+                    expected = pd.read_csv(f'{tmp_dir}/result.tsv', sep='\t', index_col=0)
+                    merged = pd.read_csv(f'{tmp_dir}/merged.tsv', sep='\t', index_col=0)
+
+                    # The permutations do not depend on the shards; the correlations only up to rounding of the tiles
+                    pd.testing.assert_frame_equal(merged, expected, check_exact=False, rtol=1e-9)
+                    pd.testing.assert_frame_equal(merged[['P-value(12)', 'P-value(21)']],
+                                                  expected[['P-value(12)', 'P-value(21)']], check_exact=True)
+
+                    with self.assertRaises(ValueError):
+                        interaction_analysis.merge_results(shards[1:], f'{tmp_dir}/merged.tsv')
+
+    def test_integer_feature_ids(self):
+        table = random_table(index=np.arange(100, 112))
+
+        analyzer = interaction_analysis.Analyzer()
+        analyzer.asv_table = table
+        expected = analyzer.evaluate_feature_association(None, seed=1, directionality='exact')
+        expected[['Feature1', 'Feature2']] = expected[['Feature1', 'Feature2']].astype(str)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            analyzer.evaluate_feature_association(f'{tmp_dir}/result.tsv', seed=1, directionality='exact')
+            pd.testing.assert_frame_equal(writer.read_results(f'{tmp_dir}/result.tsv', index_col=0), expected,
+                                          check_index_type=False)
+
+            for k in [1, 2]:
+                analyzer.evaluate_feature_association(f'{tmp_dir}/result.{k}.tsv', seed=1, directionality='exact',
+                                                      shard=(k, 2))
+            interaction_analysis.merge_results([f'{tmp_dir}/result.1.tsv', f'{tmp_dir}/result.2.tsv'],
+                                               f'{tmp_dir}/merged.tsv')
+            pd.testing.assert_frame_equal(writer.read_results(f'{tmp_dir}/merged.tsv', index_col=0), expected,
+                                          check_index_type=False, check_exact=False, rtol=1e-9)
+
+    def test_sort_results(self):
+        rng = np.random.default_rng(0)
+        table = random_table().values
+        ix_list = np.array(['ASV%d' % i for i in range(12)], dtype=object)
+        df = interaction_analysis.result_table(
+            interaction_analysis.evaluate_pairs(table, 0, 12, 0, 12, directionality='exact'), ix_list)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rw = writer.ResultWriter(f'{tmp_dir}/raw.tsv', interaction_analysis.RESULT_COLUMNS)
+            rw.write(df.iloc[rng.permutation(len(df))])
+            rw.close()
+            n = interaction_analysis.sort_results(f'{tmp_dir}/raw.tsv', f'{tmp_dir}/sorted.tsv', ix_list, chunksize=7)
+            self.assertEqual(n, len(df))
+            self.assertListEqual(sorted(os.listdir(tmp_dir)), ['raw.tsv', 'sorted.tsv'])
+
+            expected = df.copy()
+            expected.index = interaction_analysis.feature_pair_index(df, ix_list)
+            expected = expected.sort_index()
+            pd.testing.assert_frame_equal(writer.read_results(f'{tmp_dir}/sorted.tsv', index_col=0), expected,
+                                          check_names=False)
+
+    def test_tile_size(self):
+        size = interaction_analysis.tile_size(1024, 1000, 4)
+        memory = (size**2 * interaction_analysis.BYTES_PER_PAIR
+                  + size * 1000 * interaction_analysis.BYTES_PER_VALUE) * 4
+        self.assertLessEqual(memory, 1024 * 2**20)
+        self.assertGreater(size, 100)
+
+    def test_permutation_null(self):
+        rs = interaction_analysis.permutation_null(5, 7, 20, n_permutations=99)
+        self.assertEqual(rs.shape, (99, 2))
+
+    def test_resume(self):
+        # Feature names and integer feature IDs
+        for index in [None, np.arange(100, 112)]:
+            table = random_table(index=index)
+            with self.subTest(index=index):
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    analyzer = interaction_analysis.Analyzer()
+                    analyzer.asv_table = table
+                    analyzer.evaluate_feature_association(f'{tmp_dir}/result.tsv', seed=7, max_memory=0.01)
+                    with open(f'{tmp_dir}/result.tsv') as f:
+                        expected = f.read()
+                    self.assertFalse(os.path.exists(f'{tmp_dir}/result.tsv.checkpoint'))
+
+                    # Interrupts the analysis after two tiles
+                    write = writer.ResultWriter.write
+                    calls = []
+
+                    def interrupted_write(rw, df):
+                        calls.append(1)
+                        if len(calls) > 2:
+                            raise KeyboardInterrupt
+                        write(rw, df)
+
+                    table.to_csv(f'{tmp_dir}/table.tsv', sep='\t')
+                    analyzer = interaction_analysis.Analyzer()
+                    analyzer.load_feature_table(f'{tmp_dir}/table.tsv', preprocessing=False)
+                    with mock.patch.object(writer.ResultWriter, 'write', interrupted_write):
+                        with self.assertRaises(KeyboardInterrupt):
+                            analyzer.evaluate_feature_association(f'{tmp_dir}/result2.tsv', seed=7, max_memory=0.01,
+                                                                  checkpoint_interval=0)
+                    self.assertTrue(os.path.exists(f'{tmp_dir}/result2.tsv.checkpoint'))
+
+                    # The settings of the table and the seed should be those of the checkpoint
+                    table.iloc[:6].to_csv(f'{tmp_dir}/table2.tsv', sep='\t')
+                    analyzer = interaction_analysis.Analyzer()
+                    for kwargs in [{'filename': f'{tmp_dir}/table2.tsv'}, {'depth': 500}, {'preprocessing': True}]:
+                        with self.assertRaises(ValueError):
+                            analyzer.load_checkpoint(f'{tmp_dir}/result2.tsv', **kwargs)
+                    self.assertTrue(analyzer.load_checkpoint(f'{tmp_dir}/result2.tsv', f'{tmp_dir}/table.tsv',
+                                                             preprocessing=False))
+                    with self.assertRaises(ValueError):
+                        analyzer.evaluate_feature_association(f'{tmp_dir}/result2.tsv', seed=8, max_memory=0.01,
+                                                              resume=True)
+
+                    analyzer = interaction_analysis.Analyzer()
+                    self.assertTrue(analyzer.load_checkpoint(f'{tmp_dir}/result2.tsv'))
+                    analyzer.evaluate_feature_association(f'{tmp_dir}/result2.tsv', max_memory=0.01, resume=True)
+                    with open(f'{tmp_dir}/result2.tsv') as f:
+                        self.assertEqual(f.read(), expected)
+
+    def test_sequential_pvalue(self):
+        def n_permutations(rng):
+            return sum(c.kwargs['size'] for c in rng.hypergeometric.call_args_list)
+
+        # Clearly non-significant pairs stop early
+        rng = mock.Mock(wraps=np.random.default_rng(0))
+        ps = interaction_analysis.sequential_pvalue(10, 20, 30, 60, rng)
+        self.assertLessEqual(n_permutations(rng), 200)
+        self.assertGreater(min(ps), 0.2)
+
+        # Significant pairs stop after n_permutations
+        rng = mock.Mock(wraps=np.random.default_rng(0))
+        ps = interaction_analysis.sequential_pvalue(20, 20, 30, 60, rng)
+        self.assertEqual(n_permutations(rng), 999)
+        self.assertAlmostEqual(max(ps), 1 / 1000)
+
+        # Pairs close to the cutoff get more permutations
+        rng = mock.Mock(wraps=np.random.default_rng(0))
+        ps = interaction_analysis.sequential_pvalue(13, 20, 30, 60, rng, max_permutations=5000)
+        self.assertGreater(n_permutations(rng), 999)
+        self.assertLessEqual(n_permutations(rng), 5000)
+        self.assertAlmostEqual(ps[1], 0.04, delta=0.015)
+
+    def test_exact_pvalue(self):
+        # Enumerates every arrangement of the second presence vector
+        v1 = np.array([1, 1, 1, 1, 1, 1, 0, 0, 0, 0], dtype=bool)
+        n = len(v1)
+        for v2_ones in [[0, 1, 2, 6], [0, 6, 7, 8], [0, 1, 2, 3, 4, 5, 6], [7, 8]]:
+            v2 = np.zeros(n, dtype=bool)
+            v2[v2_ones] = True
+            lr_ori12, lr_ori21 = interaction_analysis.ct_info(
+                interaction_analysis.contingency_table(v1, v2))
+
+            rs = []
+            for ones in itertools.combinations(range(n), len(v2_ones)):
+                rv2 = np.zeros(n, dtype=bool)
+                rv2[list(ones)] = True
+                rs.append(interaction_analysis.ct_info(
+                    interaction_analysis.contingency_table(v1, rv2)))
+            rs = np.array(rs)
+
+            expected = []
+            for val, vs in [(lr_ori12, rs[:, 0]), (lr_ori21, rs[:, 1])]:
+                if val > 0:
+                    expected.append(np.mean(vs > val))
+                else:
+                    expected.append(np.mean(vs < val))
+
+            p12, p21 = interaction_analysis.exact_pvalue(
+                int(np.sum(v1 & v2)), int(np.sum(v1)), int(np.sum(v2)), n)
+            self.assertAlmostEqual(p12, expected[0])
+            self.assertAlmostEqual(p21, expected[1])
+
+        # The limit of the permutation p-values, including pairs with tied tables
+        for n12, n1, n2, n in [(5, 10, 12, 30), (9, 10, 12, 30), (28, 29, 30, 31)]:
+            rs = interaction_analysis.permutation_null(n1, n2, n, n_permutations=19999, seed=0)
+            lr_ori = interaction_analysis.ct_info(interaction_analysis.count_table(n12, n1, n2, n))
+            for d, p in enumerate(interaction_analysis.exact_pvalue(n12, n1, n2, n)):
+                self.assertAlmostEqual(p, interaction_analysis.permut_pvalue(lr_ori[d], rs[:, d]), delta=0.01)
@@ -0,0 +1,49 @@
+"""
+Tests for the command line
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+
+from minet import arguments, network
+
+
+class TestMain(unittest.TestCase):
+    def test_lazy_imports(self):
+        # The arguments are parsed without the numeric stack
+        script = ('import sys, json\n'
+                  'from minet.main import main\n'
+                  'sys.argv = ["minet"] + sys.argv[1:]\n'
+                  'try:\n'
+                  '    main()\n'
+                  'except SystemExit:\n'
+                  '    pass\n'
+                  'print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in '
+                  '("numpy", "pandas", "scipy", "statsmodels", "psutil", "tqdm"))))')
+        for command in [[], ['--help'], ['interaction', '--help'], ['network', '--help'], ['run', '--help']]:
+            proc = subprocess.run([sys.executable, '-c', script] + command, capture_output=True, text=True,
+                                  check=True)
+            self.assertListEqual(json.loads(proc.stdout.strip().splitlines()[-1]), [], command)
+
+    def test_network_formats(self):
+        self.assertListEqual(sorted(arguments.NETWORK_FORMATS), sorted(network.FORMATS))
+
+    def test_sweep_output(self):
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        filename = f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv'
+
+        # The statistics of a sweep are not written to the default network file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            script = 'import sys\nfrom minet.main import main\nsys.argv[0] = "minet"\nmain()'
+            subprocess.run([sys.executable, '-c', script, 'network', '-i', filename, '--sweep-fdr-cooccurrence', '0.01',
+                            '0.05'], cwd=tmp_dir, capture_output=True, check=True,
+                           env=dict(os.environ, PYTHONPATH=os.path.dirname(current_dir)))
+            self.assertListEqual(os.listdir(tmp_dir), ['network_sweep.tsv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+Tests for the metrics of the analysis stages
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from minet import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage(self):
+        mt = metrics.Metrics()
+        with mt.stage('evaluation', pairs=1000) as record:
+            record['tiles'] = 4
+        stage = mt.stages['evaluation']
+        self.assertEqual(stage['tiles'], 4)
+        self.assertGreater(stage['seconds'], 0)
+        self.assertAlmostEqual(stage['pairs_per_second'], 1000 / stage['seconds'])
+        self.assertGreater(stage['peak_rss_mb'], 0)
+
+        # A failing stage is still measured
+        with self.assertRaises(RuntimeError):
+            with mt.stage('failing'):
+                raise RuntimeError
+        self.assertIn('seconds', mt.stages['failing'])
+        self.assertNotIn('pairs_per_second', mt.stages['failing'])
+
+    def test_write(self):
+        mt = metrics.Metrics()
+        with mt.stage('load_table', features=10):
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'metrics.json')
+            mt.write(filename)
+            with open(filename) as f:
+                summary = json.load(f)
+        self.assertEqual(summary['stages']['load_table']['features'], 10)
+        self.assertGreaterEqual(summary['peak_rss_mb'], summary['stages']['load_table']['peak_rss_mb'])
+
+
+if __name__ == '__main__':
+    unittest.main()
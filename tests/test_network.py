@@ -4,7 +4,14 @@ Tests for network representation
 
 import os
 import logging
+import tempfile
 import unittest
+import importlib.util
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
 from minet import network
 
 
@@ -16,6 +23,46 @@ class TestInteractionAnalysis(unittest.TestCase):
         nt.load_interaction_results(
             f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv')
 
+    def test_load_interaction_results(self):
+        current_dir = os.path.dirname(__file__)
+        filename = f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv'
+        association = pd.read_csv(filename, sep='\t')
+
+        for co_type, qt_type in [('positive', 'positive'), ('negative', 'all'), ('all', 'negative')]:
+            nt = network.Network()
+            nt.load_interaction_results(filename, fdr_co=0.1, fdr_qt=0.1, co_type=co_type, qt_type=qt_type)
+
+            # The nodes and edges of the pairs in the order of the results
+            nodes, edges = {}, {}
+            for _, row in association.iterrows():
+                if not (row['Adjusted-P(Pearson)'] < 0.1 and row['Adjusted-P(FisherExact)'] < 0.1):
+                    continue
+                if co_type != 'all' and (row['LogOddsRatio'] > 0) != (co_type == 'positive'):
+                    continue
+                if qt_type != 'all' and (row['Rho'] > 0) != (qt_type == 'positive'):
+                    continue
+                nodes[row['Feature1']] = {'name': row['Feature1']}
+                nodes[row['Feature2']] = {'name': row['Feature2']}
+                for e, p in [((row['Feature1'], row['Feature2']), row['P-value(12)']),
+                             ((row['Feature2'], row['Feature1']), row['P-value(21)'])]:
+                    if p < 0.05:
+                        edges[e] = {'Rho': row['Rho'], 'LogOddsRatio': row['LogOddsRatio']}
+            self.assertEqual(list(nt.nodes.items()), list(nodes.items()))
+            self.assertEqual(list(nt.edges.items()), list(edges.items()))
+
+    def test_merge_edges(self):
+        nt = network.Network()
+        nt.node_names = np.array(['a', 'b', 'c'], dtype=object)
+        nt.edge_source = np.array([0, 1, 0, 2])
+        nt.edge_target = np.array([1, 2, 1, 0])
+        nt.edge_rho = np.array([0.1, 0.2, 0.3, 0.4])
+        nt.edge_log_odds_ratio = np.array([1., 2., 3., 4.])
+        nt._merge_edges()
+        self.assertEqual(nt.edges, {('a', 'b'): {'Rho': 0.3, 'LogOddsRatio': 3.},
+                                    ('b', 'c'): {'Rho': 0.2, 'LogOddsRatio': 2.},
+                                    ('c', 'a'): {'Rho': 0.4, 'LogOddsRatio': 4.}})
+        self.assertEqual(list(nt.edges), [('a', 'b'), ('b', 'c'), ('c', 'a')])
+
     def test_write_graph(self):
         current_dir = os.path.dirname(__file__)
 
@@ -24,3 +71,77 @@ class TestInteractionAnalysis(unittest.TestCase):
             f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv')
         nt.write_graph(
             f'{current_dir}/data/conditional_occurrence_directionality/graph_test.xml')
+
+    def test_write_graph_formats(self):
+        current_dir = os.path.dirname(__file__)
+
+        nt = network.Network()
+        nt.load_interaction_results(
+            f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv')
+        names, source, target, rho, log_odds_ratio = nt.edge_arrays()
+        self.assertGreater(len(source), 0)
+        self.assertListEqual(list(zip(names[source], names[target])), list(nt.edges))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            nt.write_graph(f'{tmp_dir}/network.npz')
+            with np.load(f'{tmp_dir}/network.npz') as f:
+                np.testing.assert_array_equal(f['nodes'], names)
+                np.testing.assert_array_equal(f['source'], source)
+                np.testing.assert_array_equal(f['Rho'], rho)
+
+            nt.write_graph(f'{tmp_dir}/network.csr.npz')
+            adjacency = sparse.load_npz(f'{tmp_dir}/network.csr.npz')
+            self.assertEqual(adjacency.nnz, len(source))
+            np.testing.assert_array_equal(adjacency[source, target].A1, rho)
+            with np.load(f'{tmp_dir}/network.csr.npz') as f:
+                self.assertEqual(dict(zip(zip(*adjacency.nonzero()), f['LogOddsRatio'])),
+                                 dict(zip(zip(source, target), log_odds_ratio)))
+
+            # The file name is kept with an explicit format
+            for format in ['npz', 'csr']:
+                nt.write_graph(f'{tmp_dir}/graph.{format}', format=format)
+                self.assertTrue(os.path.exists(f'{tmp_dir}/graph.{format}'))
+                self.assertFalse(os.path.exists(f'{tmp_dir}/graph.{format}.npz'))
+
+            nt.write_graph(f'{tmp_dir}/network.graphml')
+            ns = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+            graph = ElementTree.parse(f'{tmp_dir}/network.graphml').getroot().find('g:graph', ns)
+            self.assertEqual(len(graph.findall('g:node', ns)), len(names))
+            self.assertEqual(len(graph.findall('g:edge', ns)), len(source))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_write_graph_parquet(self):
+        current_dir = os.path.dirname(__file__)
+
+        nt = network.Network()
+        nt.load_interaction_results(
+            f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            nt.write_graph(f'{tmp_dir}/network.parquet')
+            self.assertTrue(os.path.exists(f'{tmp_dir}/network.nodes.parquet'))
+
+    def test_graph_format(self):
+        self.assertEqual(network.graph_format('a.xml'), 'xgmml')
+        self.assertEqual(network.graph_format('a.csr.npz'), 'csr')
+        self.assertEqual(network.graph_format('a.npz'), 'npz')
+        self.assertEqual(network.graph_format('a.GraphML'), 'graphml')
+        self.assertEqual(network.graph_format('a.txt'), 'xgmml')
+
+    def test_sweep_thresholds(self):
+        current_dir = os.path.dirname(__file__)
+        filename = f'{current_dir}/data/conditional_occurrence_directionality/microbial_association_direction.tsv'
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats = network.sweep_thresholds(filename, [0.1, 0.001, 0.05], [0.01, 0.05], [0.01, 0.05],
+                                             network_prefix=f'{tmp_dir}/network')
+            self.assertEqual(len(stats), 12)
+            for _, row in stats.iterrows():
+                co, qt, pd_cut = row['FDR(Cooccurrence)'], row['FDR(Quantitative)'], row['P-value(Directionality)']
+                nt = network.Network()
+                nt.load_interaction_results(filename, fdr_co=co, fdr_qt=qt, pval_dir=pd_cut)
+                self.assertEqual(row['Nodes'], len(nt.node_names))
+                self.assertEqual(row['Edges'], len(nt.edge_source))
+
+                nt.write_graph(f'{tmp_dir}/expected.xml')
+                with open(f'{tmp_dir}/expected.xml') as f, open(f'{tmp_dir}/network.{co:g}_{qt:g}_{pd_cut:g}.xml') as g:
+                    self.assertEqual(f.read(), g.read())
@@ -0,0 +1,52 @@
+"""
+Tests for the in-process pipeline
+"""
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from minet import pipeline, synthetic, interaction_analysis, network, writer
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run(self):
+        table, _ = synthetic.generate_feature_table(30, 60, sparsity=0.5, depth=(20000, 0.2), n_directional=3,
+                                                    seed=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            # Interaction analysis and network through the result file
+            analyzer = interaction_analysis.Analyzer()
+            analyzer.set_feature_table(table, seed=1)
+            analyzer.evaluate_feature_association(os.path.join(tmp, 'results.tsv'), directionality='exact', seed=1)
+            expected = writer.read_results(os.path.join(tmp, 'results.tsv'), index_col=0)
+            nt = network.Network()
+            nt.load_interaction_results(os.path.join(tmp, 'results.tsv'), fdr_co=0.2, fdr_qt=0.2)
+
+            # In memory
+            results, nt2 = pipeline.run(table, os.path.join(tmp, 'network.xml'), seed=1, fdr_co=0.2, fdr_qt=0.2,
+                                        directionality='exact')
+            pd.testing.assert_frame_equal(results, expected)
+            self.assertGreater(len(nt2.edges), 0)
+            self.assertEqual(list(nt2.nodes), list(nt.nodes))
+            self.assertEqual(list(nt2.edges), list(nt.edges))
+            # The result file is parsed with the last digit rounded
+            for e, properties in nt.edges.items():
+                for k, v in properties.items():
+                    self.assertAlmostEqual(nt2.edges[e][k], v, places=12)
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'network.xml')))
+
+            # With the result file
+            pipeline.run(table, results_output=os.path.join(tmp, 'results2.tsv'), seed=1, directionality='exact')
+            pd.testing.assert_frame_equal(writer.read_results(os.path.join(tmp, 'results2.tsv'), index_col=0),
+                                          expected)
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'results2.tsv.raw.tsv')))
+
+            with self.assertRaises(ValueError):
+                pipeline.run(table, seed=1, shard=(1, 2))
+            with self.assertRaises(ValueError):
+                pipeline.run(table, seed=1, resume=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
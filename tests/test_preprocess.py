@@ -0,0 +1,57 @@
+"""
+Tests for preprocessing
+"""
+
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from minet import preprocess, feature_table
+
+
+class TestPreprocess(unittest.TestCase):
+    def setUp(self):
+        current_dir = os.path.dirname(__file__)
+        self.table = pd.read_csv(
+            f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', sep='\t', header=0, index_col=0)
+
+    def test_undersampling_by_depth(self):
+        pr = preprocess.Preprocessor(self.table, seed=1)
+        pr.undersampling_by_depth(5000)
+
+        kept = self.table.columns[self.table.sum(axis=0) >= 5000]
+        self.assertListEqual(list(pr.table.columns), list(kept))
+        self.assertTrue((pr.table.sum(axis=0) == 5000).all())
+        self.assertTrue((pr.table.values <= self.table.loc[:, kept].values).all())
+
+        # Reproducible with the seed, regardless of the number of threads
+        pr2 = preprocess.Preprocessor(self.table, seed=1, n_jobs=3)
+        pr2.undersampling_by_depth(5000)
+        pd.testing.assert_frame_equal(pr.table, pr2.table)
+
+    def test_filter_by_prevalence(self):
+        pr = preprocess.Preprocessor(self.table)
+        pr.filter_by_prevalence(0.3)
+
+        m = self.table.shape[1]
+        expected = [ix for ix, row in self.table.iterrows()
+                    if float(np.count_nonzero(row)) / m > 0.3]
+        self.assertListEqual(list(pr.table.index), expected)
+
+    def test_sparse(self):
+        sparse_table = feature_table.read_table(
+            os.path.join(os.path.dirname(__file__), 'data/conditional_occurrence_directionality/feature-table.tsv'),
+            sparse_table=True)
+
+        pr = preprocess.Preprocessor(self.table, seed=1)
+        pr.undersampling_by_depth(5000)
+        pr.filter_by_prevalence(0.3)
+        sparse_pr = preprocess.Preprocessor(sparse_table, seed=1)
+        sparse_pr.undersampling_by_depth(5000)
+        sparse_pr.filter_by_prevalence(0.3)
+
+        self.assertTrue(feature_table.is_sparse(sparse_pr.table))
+        self.assertListEqual(list(sparse_pr.table.index), list(pr.table.index))
+        self.assertListEqual(list(sparse_pr.table.columns), list(pr.table.columns))
+        np.testing.assert_array_equal(sparse_pr.table.sparse.to_dense().values, pr.table.values)
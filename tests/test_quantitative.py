@@ -0,0 +1,47 @@
+"""
+Tests for quantitative association evaluation
+"""
+
+import os
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+from minet import quantitative
+
+
+class TestQuantitative(unittest.TestCase):
+    def test_log_pearson_matrix(self):
+        current_dir = os.path.dirname(__file__)
+
+        table = pd.read_csv(
+            f'{current_dir}/data/conditional_occurrence_directionality/feature-table.tsv', sep='\t', header=0, index_col=0)
+        table = table.iloc[:40, :].values
+
+        rho, pv, n = quantitative.log_pearson_matrix(table, block_size=16)
+        for i in range(len(table)):
+            for j in range(i):
+                r, p, c = quantitative.log_pearson(table[i], table[j])
+                self.assertEqual(c, n[i, j])
+                self.assertAlmostEqual(r, rho[i, j], places=10)
+                self.assertTrue(np.isclose(p, pv[i, j], rtol=1e-8, atol=1e-300))
+
+    def test_log_pearson_matrix_guards(self):
+        table = np.zeros((4, 20))
+        table[0, :] = 3       # constant
+        table[1, :] = np.arange(1, 21)
+        table[2, :5] = [1, 2, 3, 4, 5]  # less than MIN_SAMPLES co-present samples
+        table[3, :] = np.arange(20, 0, -1)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            rho, pv, n = quantitative.log_pearson_matrix(table)
+            for i in range(len(table)):
+                for j in range(i):
+                    r, p, c = quantitative.log_pearson(table[i], table[j])
+                    self.assertEqual(c, n[i, j])
+                    self.assertTrue(np.isclose(r, rho[i, j], equal_nan=True))
+                    self.assertTrue(np.isclose(p, pv[i, j], equal_nan=True))
+        self.assertEqual(rho[2, 1], 0)
+        self.assertEqual(pv[2, 1], 1.)
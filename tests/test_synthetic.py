@@ -0,0 +1,46 @@
+"""
+Tests for synthetic data generation
+"""
+
+import unittest
+
+import numpy as np
+from minet import synthetic, feature_table, interaction_analysis
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_feature_table(self):
+        table, pairs = synthetic.generate_feature_table(200, 80, sparsity=0.7, depth=(5000, 0.2), n_directional=5,
+                                                        seed=0)
+        self.assertEqual(table.shape, (200, 80))
+        self.assertAlmostEqual((table.values == 0).mean(), 0.7, delta=0.05)
+        self.assertAlmostEqual(np.median(table.sum(axis=0)), 5000, delta=1000)
+
+        self.assertEqual(len(pairs), 5)
+        self.assertEqual(len({f for p in pairs for f in p}), 10)
+        for source, target in pairs:
+            self.assertFalse(((table.loc[target] > 0) & (table.loc[source] == 0)).any())
+
+        table2, pairs2 = synthetic.generate_feature_table(200, 80, sparsity=0.7, depth=(5000, 0.2), n_directional=5,
+                                                          seed=0, sparse_table=True)
+        self.assertTrue(feature_table.is_sparse(table2))
+        np.testing.assert_array_equal(feature_table.feature_matrix(table2).toarray(), table.values)
+        self.assertListEqual(pairs2, pairs)
+
+        with self.assertRaises(ValueError):
+            synthetic.generate_feature_table(10, 10, n_directional=6)
+
+    def test_results(self):
+        df = synthetic.generate_results(30, seed=0)
+        self.assertEqual(len(df), 30 * 29 // 2)
+        self.assertTrue(set(interaction_analysis.RESULT_COLUMNS) <= set(df.columns))
+        self.assertFalse(df.duplicated(['Feature1', 'Feature2']).any())
+        self.assertTrue((df['Feature1'] > df['Feature2']).all())
+
+        df = synthetic.generate_results(30, n_pairs=100, seed=0)
+        self.assertEqual(len(df), 100)
+        self.assertFalse(df.duplicated(['Feature1', 'Feature2']).any())
+
+
+if __name__ == '__main__':
+    unittest.main()
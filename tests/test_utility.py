@@ -0,0 +1,114 @@
+"""
+Tests for utilities
+"""
+
+import os
+import threading
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+from minet import utility
+
+
+def job_square(q_job, q_result):
+    while True:
+        j = q_job.get()
+        if j['type'] == 'CONTROL':
+            break
+        q_result.put(j['value'] ** 2)
+
+
+def job_exit(q_job, q_result):
+    while True:
+        j = q_job.get()
+        if j['type'] == 'CONTROL':
+            break
+        if j['value'] == 3:
+            os._exit(1)
+        q_result.put(j['value'])
+
+
+class TestUtility(unittest.TestCase):
+    def test_lru_cache(self):
+        cache = utility.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # 'b' is the least recently used value
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 2)
+
+    def test_lru_cache_threads(self):
+        # A put from another thread (as from the threads of the CacheManager) between the lookup and the update of
+        # a get evicts the key unless it waits for the get
+        cache = utility.LRUCache(2)
+        threads = []
+
+        class InterruptedDict(OrderedDict):
+            def __contains__(self, key):
+                found = super().__contains__(key)
+                if not threads:
+                    threads.append(threading.Thread(target=cache.put, args=('c', 3)))
+                    threads[0].start()
+                    threads[0].join(0.1)
+                return found
+
+        cache.data = InterruptedDict()
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        threads[0].join()
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_shared_lru_cache(self):
+        cman = utility.CacheManager()
+        cman.start()
+        cache = cman.LRUCache(4)
+        cache.put((1, 2, 3), [0.5])
+        self.assertEqual(cache.get((1, 2, 3)), [0.5])
+        self.assertIsNone(cache.get((1, 2, 4)))
+        self.assertEqual(cache.stats()['hits'], 1)
+        cman.shutdown()
+
+    def test_stream_jobs(self):
+        jman = utility.Manager(job_square, 2)
+        try:
+            res = list(jman.stream_jobs(range(10), n_pending=3))
+        finally:
+            jman.terminate()
+        self.assertListEqual(sorted(res), [k ** 2 for k in range(10)])
+        self.assertEqual(jman.queue_stats['jobs'], 10)
+        self.assertEqual(jman.queue_stats['max_pending'], 3)
+
+    def test_stream_jobs_worker_exit(self):
+        jman = utility.Manager(job_exit, 2)
+        res = []
+        try:
+            with self.assertRaises(RuntimeError):
+                for r in jman.stream_jobs(range(10), n_pending=3, poll_interval=0.1):
+                    res.append(r)
+        finally:
+            jman.terminate()
+        self.assertNotIn(3, res)
+
+    def test_shared_array(self):
+        array = np.arange(12, dtype=float).reshape(3, 4)
+        shared = utility.SharedArray.create(array)
+        attached = utility.SharedArray.attach(shared.spec)
+        np.testing.assert_array_equal(attached.array, array)
+
+        # Both arrays use the same memory
+        shared.array[1, 2] = -1
+        self.assertEqual(attached.array[1, 2], -1)
+        attached.close()
+        shared.close()
@@ -0,0 +1,33 @@
+"""
+Tests for result file handling
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from minet import writer
+
+
+class TestWriter(unittest.TestCase):
+    def test_result_writer(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'Feature1': ['%03d' % i for i in range(25)],
+                           'Feature2': ['ASV%d' % i for i in range(25)],
+                           'N12': rng.integers(0, 100, 25),
+                           'P-value': rng.random(25) ** 10})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = os.path.join(tmp_dir, 'result.raw.tsv')
+            rw = writer.ResultWriter(fn, df.columns, batch_size=10)
+            for i in range(0, 25, 5):
+                rw.write(df.iloc[i:i + 5])
+                # batches are written as they are filled
+                self.assertEqual(rw.n_rows, (i + 5) // 10 * 10)
+            rw.close()
+            self.assertEqual(rw.n_rows, 25)
+
+            res = writer.read_results(fn)
+        pd.testing.assert_frame_equal(res, df, check_dtype=False)